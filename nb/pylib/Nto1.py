@@ -1,28 +1,122 @@
 
 from neuron import *
+from checkpoint import *
+from brian2.core.namespace import get_local_namespace
 
 μₓ = 4 * Hz
 σ = sqrt(0.6)
 μ = log(μₓ / Hz) - σ**2 / 2
 
-def Nto1(N=6500, vars_to_record=["V"]):
+def Nto1(N=6500, vars_to_record=["V"], n_tracked=None, weights_as_vars=False,
+         burn_in=None, tag={}):
+    """
+    With `weights_as_vars`, `we` and `wi` are (shared) variables of the neuron `n`,
+    to be set as `n.we = …`, instead of being taken from the namespace at `run` time.
 
+    With `n_tracked`, only that many inputs get their own spike train and synapse
+    (the rest being merged into one `PoissonInput` for exc and one for inh).
+    The returned objects then also include these two `PoissonInput`s, after `Si`.
+    See `tracked_inputs` to find which inputs the neurons of `P` are.
+
+    With `burn_in` (a duration), the network is returned in its state after a run of
+    that length (without recording): loaded from disk if this was simulated before,
+    else simulated and saved (see `checkpoint.py`). Monitors then start recording at
+    t = `burn_in`. `tag` must contain whatever else determines that state, such as
+    the `seed`. The weights are added to it automatically: taken from the caller's
+    namespace, or, with `weights_as_vars`, from `tag["we"]` and `tag["wi"]`.
+    """
     Ne = N * 4//5
     print(f"{Ne=}")
 
-    n = COBA_AdEx_neuron()
+    if n_tracked is None:
+        Ne_tracked, Ni_tracked = Ne, N - Ne
+    else:
+        Ne_tracked, Ni_tracked = split_tracked(N, n_tracked)
+        Ne_merged = Ne - Ne_tracked
+        Ni_merged = N - Ne - Ni_tracked
+        print(f"{Ne_tracked=}, {Ni_tracked=}, {Ne_merged=}, {Ni_merged=}")
+
+    n = COBA_AdEx_neuron(weights_as_vars=weights_as_vars)
 
-    rates = lognormal(μ, σ, N) * Hz
-    P = PoissonGroup(N, rates)
+    N_tracked = Ne_tracked + Ni_tracked
+    rates = lognormal(μ, σ, N_tracked) * Hz
+    P = PoissonGroup(N_tracked, rates)
 
     Se = Synapses(P, n, on_pre="ge += we")
     Si = Synapses(P, n, on_pre="gi += wi")
-    Se.connect("i < Ne")
-    Si.connect("i >= Ne")
+    Se.connect("i < Ne_tracked")
+    Si.connect("i >= Ne_tracked")
 
     M = StateMonitor(n, vars_to_record, record=[0])
     S = SpikeMonitor(n)
     SP = SpikeMonitor(P)
 
-    objs = [n, P, Se, Si, M, S, SP]
-    return *objs, Network(objs)
+    if n_tracked is None:
+        objs = [n, P, Se, Si, M, S, SP]
+    else:
+        # The mean of our lognormal input rate distribution is μₓ.
+        # (A `PoissonInput` with N = 0 is not allowed; hence the `max`).
+        PIe = PoissonInput(n, 'ge', max(Ne_merged, 1), μₓ * (Ne_merged > 0), "we")
+        PIi = PoissonInput(n, 'gi', max(Ni_merged, 1), μₓ * (Ni_merged > 0), "wi")
+        objs = [n, P, Se, Si, PIe, PIi, M, S, SP]
+
+    net = Network(objs)
+    if burn_in is not None:
+        if weights_as_vars:
+            n.we, n.wi = tag["we"], tag["wi"]
+        else:
+            ns = get_local_namespace(level=1)
+            tag = {**tag, "we": ns["we"], "wi": ns["wi"]}
+        tag = {**model_tag(), **tag, "N": N, "n_tracked": n_tracked,
+               "weights_as_vars": weights_as_vars, "vars_to_record": vars_to_record}
+        start_from_burn_in(objs, net, burn_in, tag, level=1)
+
+    return *objs, net
+
+
+def model_tag():
+    "Everything about the model that a network's state depends on"
+    return dict(eqs=eqs, C=C, gL=gL, EL=EL, VT=VT, DT=DT, Vs=Vs, Vr=Vr, a=a, b=b,
+                tau_w=tau_w, Ee=Ee, Ei=Ei, tau_g=tau_g, μₓ=μₓ, σ=σ)
+
+
+def start_from_burn_in(objs, net, T, tag, level=0):
+    """
+    Bring `net` to its state after a run of duration `T`, with monitors off: from
+    the checkpoint with `tag` if there is one, else by simulating (and saving it).
+    """
+    tag = {**tag, "burn_in": T}
+    if load_checkpoint(objs, net, tag):
+        print(f"Loaded state after {T} burn-in")
+        return
+    monitors = [o for o in objs if isinstance(o, (StateMonitor, SpikeMonitor))]
+    for m in monitors:
+        m.active = False
+    net.run(T, level=level+1)
+    for m in monitors:
+        m.active = True
+    save_checkpoint(objs, net, tag)
+
+
+def split_tracked(N, n_tracked):
+    """
+    Number of exc and inh inputs to track, out of `n_tracked`.
+    Same E/I proportion as all N inputs; but never more than there are.
+    """
+    Ne = N * 4//5
+    Ni = N - Ne
+    Ne_tracked = min(n_tracked * 4//5, Ne)
+    Ni_tracked = min(n_tracked - Ne_tracked, Ni)
+    return Ne_tracked, Ni_tracked
+
+
+def tracked_inputs(N, n_tracked=None):
+    """
+    Index, among all N inputs (exc first, then inh), of every neuron in the
+    `PoissonGroup` of `Nto1(N, n_tracked=n_tracked)`.
+    """
+    Ne = N * 4//5
+    if n_tracked is None:
+        return arange(N)
+    Ne_tracked, Ni_tracked = split_tracked(N, n_tracked)
+    return concatenate([arange(Ne_tracked), Ne + arange(Ni_tracked)])
@@ -0,0 +1,231 @@
+
+# Pure-NumPy version of the N-to-1 AdEx simulation (`Nto1.py`, `neuron.py`).
+#
+# Instead of building a Brian network per (wₑ, seed), we advance K independent
+# trials in lockstep: every state variable is a length-K vector, and one Euler step
+# is a handful of vectorized operations on those.
+#
+# Integration order and output fields follow `Nto1AdEx.sim` (in ../../pkg/), so the
+# per-trial outputs can be used as drop-in replacements for that in notebooks
+# (e.g. `ceil_spikes_jl(out)`). As in that Julia version, outputs are plain floats,
+# in SI base units.
+
+from types import SimpleNamespace
+
+import numpy as np
+from brian2.units import second, ms, siemens, Hz, psiemens
+
+import neuron
+from Nto1 import μ, σ
+
+# Model constants as plain floats (SI units), for use in the main loop.
+C, gL, EL, VT, DT, Vs, Vr, a, b, tau_w, Ee, Ei, tau_g = (
+    float(getattr(neuron, name)) for name in
+    ["C", "gL", "EL", "VT", "DT", "Vs", "Vr", "a", "b", "tau_w", "Ee", "Ei", "tau_g"]
+)
+
+
+def sim_batch(
+        N,
+        T,
+        wₑ,
+        seed,
+        EI_ratio = 4,
+        Δt = 0.1 * ms,
+        record_V = True,
+        ceil_spikes = True,
+        keep_trains = False,
+    ):
+    """
+    Simulate K N-to-1 trials at once.
+
+    `N`, `wₑ` (a Quantity, in siemens) and `seed` are broadcast against each other,
+    to get one (N, wₑ, seed) triple per trial. Trials with the same N and seed get
+    the same input rates and spike trains (whatever their wₑ). For a full grid, pass
+    e.g. `wₑ = wₑs[:, newaxis]` and `seed = seeds`: trials are then ordered as in a
+    nested `for wₑ in wₑs: for seed in seeds` loop.
+
+    Returns a list of K namespaces, with the fields of `Nto1AdEx.sim`'s output:
+    `V` (a view into one shared K × num_steps array), `spiketimes`, `spikerate`,
+    `rates`, `seed`, `duration`, `N`, `Nₑ`, `wₑ`, `wᵢ`; and `trains` if
+    `keep_trains`.
+    """
+    Ns, wₑ, seeds = np.broadcast_arrays(N, np.asarray(wₑ / siemens, dtype=float), seed)
+    Ns, wₑ, seeds = Ns.ravel(), wₑ.ravel(), seeds.ravel()
+    wᵢ = EI_ratio * wₑ
+    K = len(wₑ)
+    T = float(T / second)
+    dt = float(Δt / second)
+    num_steps = round(T / dt)
+    Nₑs = np.round(EI_ratio / (1 + EI_ratio) * Ns).astype(int)
+
+    # Number of exc/inh input spikes arriving at each timestep, per trial.
+    # Time is the first axis, so that a step reads one contiguous row.
+    nₑ = np.zeros((num_steps, K), dtype=np.uint16)
+    nᵢ = np.zeros((num_steps, K), dtype=np.uint16)
+    inputs = {}
+    for k, key in enumerate(zip(Ns, seeds)):
+        if key not in inputs:
+            inputs[key] = poisson_inputs(*key, T=T)
+        rates, times, src = inputs[key]
+        # An input spike is processed at the first timestep at or after it.
+        i = np.ceil(times / dt).astype(int)
+        inrange = i < num_steps
+        exc = src < Nₑs[k]
+        nₑ[:, k] = np.bincount(i[inrange & exc],  minlength=num_steps)
+        nᵢ[:, k] = np.bincount(i[inrange & ~exc], minlength=num_steps)
+
+    V  = np.full(K, EL)
+    w  = np.zeros(K)
+    gₑ = np.zeros(K)
+    gᵢ = np.zeros(K)
+    V_rec = np.empty((K, num_steps)) if record_V else None
+    spike_k, spike_i = [], []
+
+    # Main sim loop
+    for i in range(num_steps):
+        gₑ += nₑ[i] * wₑ
+        gᵢ += nᵢ[i] * wᵢ
+        Iₛ = gₑ * (V - Ee) + gᵢ * (V - Ei)
+        DₜV = (-gL * (V - EL) + gL * DT * np.exp((V - VT) / DT) - Iₛ - w) / C
+        Dₜw = (a * (V - EL) - w) / tau_w
+        V  += DₜV * dt
+        w  += Dₜw * dt
+        gₑ -= gₑ / tau_g * dt
+        gᵢ -= gᵢ / tau_g * dt
+        spiked = np.flatnonzero(V > Vs)
+        if len(spiked) > 0:
+            V[spiked] = Vr
+            w[spiked] += b
+            spike_k.append(spiked)
+            spike_i.append(np.full(len(spiked), i))
+        if record_V:
+            V_rec[:, i] = V
+
+    spike_k = np.concatenate(spike_k) if spike_k else np.array([], dtype=int)
+    spike_i = np.concatenate(spike_i) if spike_i else np.array([], dtype=int)
+    if ceil_spikes and record_V:
+        V_rec[spike_k, spike_i] = Vs
+
+    outs = []
+    for k in range(K):
+        spiketimes = spike_i[spike_k == k] * dt
+        rates, times, src = inputs[Ns[k], seeds[k]]
+        out = SimpleNamespace(
+            V          = V_rec[k] if record_V else None,
+            spiketimes = spiketimes,
+            spikerate  = len(spiketimes) / T,
+            rates      = rates,
+            seed       = seeds[k],
+            duration   = T,
+            N          = Ns[k],
+            Nₑ         = Nₑs[k],
+            wₑ         = wₑ[k],
+            wᵢ         = wᵢ[k],
+        )
+        if keep_trains:
+            out.trains = spiketrains(times, src, Ns[k])
+        outs.append(out)
+    return outs
+
+
+def calibrate_we(
+        Ns,
+        target_rate = 4 * Hz,
+        seeds = range(10),
+        T = 10 * second,
+        w0 = lambda N: 15 * psiemens * (6500 / N),
+        rtol = 1e-3,
+        max_iter = 40,
+    ):
+    """
+    Find, for all `Ns` at once, the wₑ for which the output rate (averaged over
+    `seeds`) is `target_rate`.
+
+    Every iteration simulates all seeds of all not-yet-converged N together, in one
+    `sim_batch` call. The same seeds are used in every iteration ('common random
+    numbers'), so that the average rate is a deterministic, non-decreasing function
+    of wₑ. The search starts at the scaling law `w0(N)`, and works on log(wₑ): first
+    doubling or halving until the target is bracketed, then regula falsi (Illinois
+    variant) until the bracket is narrower than `rtol`, the rate is within half the
+    rate resolution (1 / (T · num_seeds)) of the target, or the next wₑ would be one
+    that was already simulated.
+
+    Returns the found wₑs, and the average output rates they achieve (no extra
+    simulations are needed for the latter: we return the best evaluated point).
+    """
+    Ns = np.asarray(Ns)
+    seeds = np.asarray(seeds)
+    n = len(Ns)
+    x = np.log([w0(N) / siemens for N in Ns])
+    lo, hi = np.full(n, np.nan), np.full(n, np.nan)
+    f_lo, f_hi = np.full(n, np.nan), np.full(n, np.nan)
+    last_side = np.zeros(n)  # -1: `lo` was updated last; +1: `hi`.
+    best_x, best_f = x.copy(), np.full(n, np.inf)
+    active = np.ones(n, dtype=bool)
+    target = float(target_rate / Hz)
+    # Average rates are multiples of 1 / (T · num_seeds); exact equality is rare.
+    f_tol = 0.5 / (float(T / second) * len(seeds))
+    for it in range(max_iter):
+        j = np.flatnonzero(active)
+        print(f"Iteration {it + 1}: {len(j)} N's to simulate")
+        outs = sim_batch(Ns[j, np.newaxis], T, np.exp(x[j, np.newaxis]) * siemens, seeds,
+                         record_V=False)
+        rate = np.array([o.spikerate for o in outs]).reshape(len(j), len(seeds)).mean(axis=1)
+        f = rate - target
+        better = np.abs(f) < np.abs(best_f[j])
+        best_x[j[better]], best_f[j[better]] = x[j[better]], f[better]
+        below = f < 0
+        for side, sel in [(-1, below), (+1, ~below)]:
+            k = j[sel]
+            # Illinois modification: if the same end moved twice in a row, halve the
+            # function value at the other end. Avoids slow one-sided convergence.
+            stuck = last_side[k] == side
+            if side == -1:
+                lo[k], f_lo[k] = x[k], f[sel]
+                f_hi[k[stuck]] /= 2
+            else:
+                hi[k], f_hi[k] = x[k], f[sel]
+                f_lo[k[stuck]] /= 2
+            last_side[k] = side
+        converged = (np.abs(f) < f_tol) | (hi[j] - lo[j] < rtol)
+        active[j[converged]] = False
+        j = np.flatnonzero(active)
+        x[j] = np.where(
+            np.isnan(lo[j]), hi[j] - np.log(2), np.where(
+            np.isnan(hi[j]), lo[j] + np.log(2),
+            (lo[j] * f_hi[j] - hi[j] * f_lo[j]) / (f_hi[j] - f_lo[j])
+        ))
+        # Regula falsi stalls on a bracket end when its f is ~0: no new information.
+        stalled = (x[j] == lo[j]) | (x[j] == hi[j])
+        active[j[stalled]] = False
+        if not active.any():
+            break
+    else:
+        print(f"Not converged after {max_iter} iterations: N = {Ns[active]}")
+    return np.exp(best_x) * siemens, (best_f + target) * Hz
+
+
+def poisson_inputs(N, seed, T):
+    """
+    Draw N lognormal input rates, and a Poisson spike train for each.
+
+    The spikes of all trains are returned together, as one array of spike times and
+    one of source indices. (A Poisson process on [0, T] is a Poisson-distributed
+    number of spikes, placed uniformly at random).
+    """
+    rng = np.random.default_rng(seed)
+    rates = rng.lognormal(μ, σ, N)
+    counts = rng.poisson(rates * T)
+    times = rng.uniform(0, T, counts.sum())
+    src = np.repeat(np.arange(N), counts)
+    return rates, times, src
+
+
+def spiketrains(times, src, N):
+    "Split a multiplexed spike stream into N sorted per-source trains"
+    order = np.lexsort((times, src))
+    bounds = np.searchsorted(src[order], np.arange(N + 1))
+    times = times[order]
+    return [times[bounds[j]:bounds[j+1]] for j in range(N)]
+
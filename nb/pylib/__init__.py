@@ -0,0 +1,80 @@
+
+# This directory as a package, with everything loaded on first use:
+#
+#     import pylib as lib
+#     lib.plotsig(…)     # Imports `plot` (and brian), but not e.g. pandas or joblib.
+#     lib.import_report()
+#
+# The modules here import each other by bare name (`from util import *`), so that
+# they also work with `%run lib/util.py`. To not end up with two copies of a module
+# (`util` and `pylib.util`), `pylib.util` is made an alias of `util`.
+
+import sys
+from importlib import import_module
+from importlib.abc import Loader, MetaPathFinder
+from importlib.util import spec_from_loader
+
+from . import lazy as _lazy
+
+sys.path.insert(0, str(_lazy.pylib_dir))
+sys.modules["lazy"] = _lazy
+from lazy import import_report
+
+
+class _AliasFinder(MetaPathFinder, Loader):
+    "Import `pylib.x` as the module `x`"
+
+    def find_spec(self, name, path = None, target = None):
+        package, _, module = name.rpartition(".")
+        if package == __name__ and (_lazy.pylib_dir / f"{module}.py").exists():
+            return spec_from_loader(name, self)
+        return None
+
+    def create_module(self, spec):
+        module = import_module(spec.name.rpartition(".")[2])
+        self.specs[module.__name__] = module.__spec__
+        return module
+
+    def exec_module(self, module):
+        # importlib has set `__spec__` to our (alias) spec. Put back the module's own,
+        # so that `reload(module)` (and `%autoreload`) re-executes it.
+        module.__spec__ = self.specs.pop(module.__name__)
+
+    specs = {}
+
+sys.meta_path.insert(0, _AliasFinder())
+
+
+# Where to find the main functions.
+exports = {
+    "plot":            ["plotsig", "rasterplot", "savefig_thesis", "hylabel", "timesig"],
+    "plotbase":        ["sett"],
+    "util":            ["units_to_header", "write_table", "read_table", "col_q",
+                        "ceil_spikes", "ceil_spikes_jl"],
+    "neuron":          ["COBA_AdEx_neuron"],
+    "Nto1":            ["Nto1", "tracked_inputs"],
+    "Nto1_numpy":      ["sim_batch", "calibrate_we"],
+    "standalone":      ["Nto1Standalone"],
+    "figures":         ["thesis_figure", "build_figures"],
+    "warmup":          ["warm_up"],
+    "checkpoint":      ["save_checkpoint", "load_checkpoint"],
+    "diskcache":       ["cache", "sweep", "set_budget", "cache_stats"],
+    "diskmonitor":     ["run_streamed", "load_streamed"],
+    "spikestore":      ["SpikeStore"],
+    "sta":             ["calc_STAs", "MultiWinSTAs", "shuffle_test"],
+    "xcorr":           ["connectivity_scores", "cross_correlograms"],
+}
+_where = {name: module for module, names in exports.items() for name in names}
+
+
+def __getattr__(name):
+    if (_lazy.pylib_dir / f"{name}.py").exists():
+        return import_module(f"{__name__}.{name}")
+    if name in _where:
+        return getattr(import_module(_where[name]), name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    modules = [p.stem for p in _lazy.pylib_dir.glob("*.py") if p.stem != "__init__"]
+    return sorted({*globals(), *modules, *_where})
@@ -0,0 +1,73 @@
+
+# Save the full state of a network to disk, to continue from it in another process.
+#
+# Brian's `net.store(filename=…)` needs all objects to have the same names as when
+# stored. But automatic names depend on how many objects were created before (e.g.
+# `neurongroup_3` in a notebook that built three networks). Here, objects are
+# identified by their position in the list of objects instead (e.g. the output of
+# `Nto1`).
+#
+# Checkpoints are tagged by a dict of everything that determines the state (model
+# parameters, weights, seed, …), and stored under a hash of that tag.
+
+import json
+import pickle
+from pathlib import Path
+
+from brian2 import get_device
+from joblib import hash as joblib_hash
+
+checkpoint_dir = "checkpoints"
+
+
+def checkpoint_path(tag, directory = None):
+    return Path(directory or checkpoint_dir) / f"{joblib_hash(tag)}.pkl"
+
+
+def save_checkpoint(objs, net, tag, directory = None):
+    "Store the state of `net`, whose objects are `objs`, under `tag`"
+    path = checkpoint_path(tag, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    names = role_names(objs)
+    state = net._full_state()
+    state = {names.get(k, k): v for k, v in state.items()}
+    state["_random_generator_state"] = get_device().get_random_state()
+    with open(path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    path.with_suffix(".json").write_text(json.dumps({k: str(v) for k, v in tag.items()}))
+    return path
+
+
+def load_checkpoint(objs, net, tag, directory = None):
+    """
+    Restore the state of `net` (including time, monitors, and random state) from the
+    checkpoint with `tag`. Returns False if there is none.
+    """
+    path = checkpoint_path(tag, directory)
+    if not path.exists():
+        return False
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    names = {role: name for name, role in role_names(objs).items()}
+    state = {names.get(k, k): v for k, v in state.items()}
+    # (`restore` reads from `_stored_state`, if not given a filename).
+    net._stored_state["_checkpoint"] = state
+    net.restore("_checkpoint", restore_random_state=True)
+    del net._stored_state["_checkpoint"]
+    return True
+
+
+def role_names(objs):
+    """
+    Name of every object in `objs` (and their sub-objects, such as the synaptic
+    pathways of a `Synapses`) → a name that depends only on its position in `objs`.
+    """
+    names = {}
+    def add(obj, role):
+        names[obj.name] = role
+        for sub in obj.contained_objects:
+            add(sub, role + sub.name[len(obj.name):] if sub.name.startswith(obj.name)
+                     else f"{role}.{sub.name}")
+    for i, obj in enumerate(objs):
+        add(obj, f"{i}_obj")
+    return names
@@ -1,12 +1,290 @@
-from joblib import Memory
+import hashlib
+import inspect
+import json
+import os
+from collections import Counter, OrderedDict
+from time import time
+from types import SimpleNamespace
+
+import numpy as np
+from joblib import Memory, hash as joblib_hash
+from joblib.disk import memstr_to_bytes
 
 disk = Memory(".")
 
+# Max size of the disk cache (in bytes, or e.g. "20G"). None: no limit.
+# See `set_budget`.
+budget = None
+eviction_policy = "cost"
+
+cached_functions = []
+
+memories = {None: disk}
+
+def memory(mmap_mode = None):
+    """
+    Joblib `Memory` at the same location as `disk`, loading arrays with the given
+    `mmap_mode`. (`disk.cache(f, mmap_mode=…)` does not work: the store, which does
+    the loading, is shared by all functions of a `Memory`).
+    """
+    if mmap_mode not in memories:
+        memories[mmap_mode] = Memory(disk.location, mmap_mode=mmap_mode)
+    return memories[mmap_mode]
+
 # Hack to be able to use Joblib in a Jupyter notebook,
 # by overwriting the default `__main__` module by a custom identifier.
-def cache(module, **joblib_kwargs):
+def cache(module, mem=True, maxsize=256, mmap=False, **joblib_kwargs):
+    """
+    Cache `f` on disk (with joblib), and, if `mem`, also in memory: the last
+    `maxsize` results are kept in an LRU dict in front of the disk cache. (Note that
+    results from the memory tier are the same objects every time: do not modify them
+    in place).
+
+    With `mmap`, arrays in the results (also Quantities, and arrays inside dicts,
+    namespaces, …) are loaded as read-only memory maps, instead of being read into
+    RAM in full. Only the parts that are used are then read from disk. (Pass
+    `mmap="c"` for copy-on-write arrays, that can be modified in memory).
+    """
+    mem_ = memory("r" if mmap is True else mmap or None)
     def cache_(f):
         f.__qualname__ = f.__name__
         f.__module__ = module
-        return disk.cache(f, **joblib_kwargs)
+        memorized = mem_.cache(f, **joblib_kwargs)
+        if not mem:
+            return memorized
+        cf = CachedFunction(f, memorized, maxsize)
+        cached_functions.append(cf)
+        return cf
     return cache_
+
+
+class CachedFunction:
+    "Memory tier in front of a joblib `MemorizedFunc`"
+
+    def __init__(self, f, memorized, maxsize):
+        self.f = f
+        self.memorized = memorized
+        self.maxsize = maxsize
+        self.memcache = OrderedDict()  # key → (output, duration)
+        self.stats = Counter()
+        self.signature = inspect.signature(f)
+        self.__name__ = f.__name__
+        self.__doc__ = f.__doc__
+
+    def key(self, *args, **kwargs):
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return tuple((name, fast_key(x)) for name, x in bound.arguments.items())
+
+    def __call__(self, *args, **kwargs):
+        k = self.key(*args, **kwargs)
+        if k in self.memcache:
+            self.memcache.move_to_end(k)
+            output, duration = self.memcache[k]
+            self.stats.update(mem_hits=1, time_saved=duration)
+            return output
+        if self.memorized.check_call_in_cache(*args, **kwargs):
+            output, duration = self.load_from_disk(k, *args, **kwargs)
+            self.stats.update(disk_hits=1, time_saved=duration)
+        else:
+            t0 = time()
+            output = self.memorized(*args, **kwargs)
+            duration = time() - t0
+            self.stats.update(misses=1, time_spent=duration)
+            if budget is not None:
+                reduce_size()
+            self.remember(k, output, duration)
+        return output
+
+    def load_from_disk(self, k, *args, **kwargs):
+        "Load a result from the disk cache (into the memory tier); with its duration"
+        r = self.memorized.call_and_shelve(*args, **kwargs)
+        output, duration = r.get(), r.duration or 0
+        self.remember(k, output, duration)
+        return output, duration
+
+    def remember(self, k, output, duration):
+        self.memcache[k] = (output, duration)
+        if len(self.memcache) > self.maxsize:
+            self.memcache.popitem(last=False)
+
+    def check_call_in_cache(self, *args, **kwargs):
+        return (self.key(*args, **kwargs) in self.memcache
+                or self.memorized.check_call_in_cache(*args, **kwargs))
+
+    def clear(self, disk=False):
+        self.memcache.clear()
+        if disk:
+            self.memorized.clear()
+
+    def __getstate__(self):
+        # Don't send the memory tier along to worker processes.
+        state = self.__dict__.copy()
+        state["memcache"] = OrderedDict()
+        return state
+
+
+def set_budget(size, policy = "cost"):
+    """
+    Limit the disk cache to `size` bytes (or e.g. "20G"; None: no limit). When a new
+    result takes it over budget, items are evicted until it is under again.
+    `policy`:
+    - "lru": least recently used first;
+    - "cost": lowest `duration / (size * age)` first, where `duration` is how long
+      the result took to compute. I.e. results that were cheap to compute, large,
+      and not used in a while go first.
+    """
+    global budget, eviction_policy
+    budget = memstr_to_bytes(size) if isinstance(size, str) else size
+    eviction_policy = policy
+    if budget is not None:
+        reduce_size()
+
+
+def reduce_size(size = None):
+    "Evict cached results, until the disk cache is at most `size` (default: `budget`)"
+    if size is None:
+        size = budget
+    items = cache_items()
+    total = sum(it.size for it in items)
+    if total <= size:
+        return
+    if eviction_policy == "lru":
+        order = sorted(items, key = lambda it: it.last_access)
+    else:
+        now = time()
+        order = sorted(items, key = lambda it:
+            it.duration / (max(it.size, 1) * max(now - it.last_access, 1)))
+    freed = 0
+    for it in order:
+        if total - freed <= size:
+            break
+        disk.store_backend.clear_location(it.path)
+        freed += it.size
+    print(f"Evicted {freed / 1e6:.1f} MB from the disk cache")
+
+
+def cache_items():
+    """
+    All results in the disk cache, with: `path`, `size` (bytes), `last_access` (Unix
+    time), `duration` (time to compute, in seconds), and `func` (function ID).
+    """
+    items = []
+    root = disk.store_backend.location
+    for it in disk.store_backend.get_items():
+        try:
+            with open(os.path.join(it.path, "metadata.json")) as f:
+                duration = json.load(f).get("duration") or 0
+        except (OSError, ValueError):
+            duration = 0
+        items.append(SimpleNamespace(
+            path        = it.path,
+            size        = it.size,
+            last_access = it.last_access.timestamp(),
+            duration    = duration,
+            func        = os.path.relpath(os.path.dirname(it.path), root),
+        ))
+    return items
+
+
+def cache_stats():
+    """
+    Per function: bytes and number of results on disk, and, for the `cache`d
+    functions called in this session: hits (in memory and on disk), misses, time
+    spent computing, and time saved by hits (i.e. what the hits took to compute).
+    """
+    stats = {}
+    for it in cache_items():
+        s = stats.setdefault(it.func, Counter())
+        s.update(bytes=it.size, items=1)
+    for cf in cached_functions:
+        func = os.path.join(*cf.memorized.func_id.split("/"))
+        stats.setdefault(func, Counter()).update(cf.stats)
+    return stats
+
+
+def print_cache_stats():
+    for func, s in cache_stats().items():
+        print(f"{func}: {s['items']} results, {s['bytes'] / 1e6:.1f} MB. "
+              f"Hits: {s['mem_hits']} (mem), {s['disk_hits']} (disk). "
+              f"Misses: {s['misses']}. Time saved: {s['time_saved']:.1f} s")
+
+
+def fast_key(x):
+    """
+    Hashable, stable key for function arguments. Fast for the common cases (numbers,
+    strings, brian2 Quantities, NumPy arrays); falls back to joblib's hashing.
+    """
+    if isinstance(x, (int, float, str, bytes, bool, type(None))):
+        # (With the type: `1 == 1.0 == True`, but joblib caches them separately).
+        return (type(x).__name__, x)
+    if isinstance(x, np.ndarray):
+        # (Includes brian2 Quantities, which are ndarrays with a `dim`).
+        dim = getattr(x, "dim", None)
+        dims = dim._dims if dim is not None else None
+        x = np.asarray(x)
+        if x.dtype == object:
+            # (Its bytes are pointers to the elements, not their values).
+            return ("joblib", joblib_hash(x))
+        if x.ndim == 0:
+            return ("array", x.dtype.str, dims, x.item())
+        return ("array", x.dtype.str, x.shape, dims, array_digest(x))
+    if isinstance(x, (list, tuple)):
+        return (type(x).__name__, tuple(fast_key(el) for el in x))
+    if isinstance(x, dict):
+        items = [(fast_key(k), fast_key(v)) for k, v in x.items()]
+        try:
+            return ("dict", tuple(sorted(items)))
+        except TypeError:
+            return ("joblib", joblib_hash(x))
+    if isinstance(x, range):
+        return ("range", x.start, x.stop, x.step)
+    return ("joblib", joblib_hash(x))
+
+
+def array_digest(x):
+    if x.size <= 64:
+        return np.ascontiguousarray(x).tobytes()
+    return hashlib.blake2b(np.ascontiguousarray(x).data, digest_size=16).digest()
+
+
+from itertools import product
+from joblib import Parallel, delayed
+
+def sweep(f, n_jobs=-1, **grid):
+    """
+    Call the `cache`d function `f` on every combination of the given keyword values,
+    e.g. `sweep(sim, wₑ=wₑs, seed=seeds)`. Returns the list of results, in the
+    order of a nested for loop over the keywords (first one outermost).
+
+    Points that are already in the disk cache are loaded from there; only the others
+    are computed, in parallel, in `n_jobs` worker processes (-1: all cores). Each
+    worker writes its results to the cache as it goes, so an interrupted sweep
+    resumes where it left off.
+    """
+    names = list(grid)
+    points = [dict(zip(names, values)) for values in product(*grid.values())]
+    misses = [p for p in points if not f.check_call_in_cache(**p)]
+    print(f"{len(points) - len(misses)} of {len(points)} points in cache. "
+          f"Computing {len(misses)} …")
+    if misses:
+        g = getattr(f, "memorized", f)  # Workers only need the disk tier
+        durations = Parallel(n_jobs=n_jobs, verbose=5)(
+            delayed(timed_call)(g, p) for p in misses)
+        if isinstance(f, CachedFunction):
+            f.stats.update(misses=len(misses), time_spent=sum(durations))
+        if budget is not None:
+            reduce_size()
+    if not isinstance(f, CachedFunction):
+        return [f(**p) for p in points]
+    # (Loading the points just computed is not a cache hit).
+    computed = {id(p) for p in misses}
+    return [f.load_from_disk(f.key(**p), **p)[0] if id(p) in computed else f(**p)
+            for p in points]
+
+
+def timed_call(g, kwargs):
+    "Call `g(**kwargs)`; return how long it took (not the result: it is on disk)"
+    t0 = time()
+    g(**kwargs)
+    return time() - t0
@@ -0,0 +1,79 @@
+
+# Stream `StateMonitor` recordings to disk while the network runs, instead of
+# keeping them in RAM. For long runs: at 0.1 ms resolution, a 10-minute recording is
+# 6M float64 samples (48 MB) per variable and per recorded neuron.
+#
+# Usage:
+#
+#     n, P, Se, Si, M, S, SP, net = Nto1(vars_to_record=["V", "ge", "gi"])
+#     rec = run_streamed(net, M, 10*minute, "data/rec")
+#     plotsig(rec.V[0], tlim=[0, 200]*ms)
+#
+# `rec.V` etc are Quantities backed by memory maps: only the parts that are used
+# are read from disk. They are opened copy-on-write, so in-place edits (such as
+# `ceil_spikes`) work, without changing the files.
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from brian2 import Quantity, second
+from brian2.units.fundamentalunits import get_or_create_dimension
+
+
+def run_streamed(net, M, T, directory, chunk = 10 * second, **run_kw):
+    """
+    Run `net` for a duration `T`, in chunks. After every chunk, the contents of the
+    `StateMonitor` `M` are appended to one `.npy` file per variable in `directory`,
+    and `M` is emptied. Returns the recording (see `load_streamed`).
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    dt = M.clock.dt
+    num_steps = round(T / dt)
+    steps_per_chunk = round(chunk / dt)
+    shape = (M.n_indices, num_steps)
+    files = {
+        var: open_memmap(directory / f"{var}.npy", "w+", M.variables[var].dtype, shape)
+        for var in M.record_variables
+    }
+    t = open_memmap(directory / "t.npy", "w+", np.float64, (num_steps,))
+    i = 0
+    while i < num_steps:
+        n = min(steps_per_chunk, num_steps - i)
+        net.run(n * dt, level=1, **run_kw)  # (`level`: use the caller's namespace)
+        # (`n` steps recorded, normally. But don't trust float rounding blindly).
+        n = min(len(M.variables["t"].get_value()), num_steps - i)
+        t[i:i+n] = M.variables["t"].get_value()[:n]
+        for var, f in files.items():
+            f[:, i:i+n] = M.variables[var].get_value()[:n].T
+        i += n
+        M.resize(0)
+    for f in [t, *files.values()]:
+        f.flush()
+    meta = {
+        var: list(M.variables[var].dim._dims)
+        for var in ["t", *M.record_variables]
+    }
+    meta["num_steps"] = i
+    (directory / "meta.json").write_text(json.dumps(meta))
+    del files, t
+    return load_streamed(directory)
+
+
+def load_streamed(directory):
+    """
+    Open a recording made with `run_streamed`. Returns a namespace with the same
+    attributes as the `StateMonitor` had (`t`, `V`, …), as memory-mapped Quantities.
+    """
+    directory = Path(directory)
+    meta = json.loads((directory / "meta.json").read_text())
+    num_steps = meta.pop("num_steps")
+    rec = SimpleNamespace()
+    for var, dims in meta.items():
+        x = np.load(directory / f"{var}.npy", mmap_mode="c")[..., :num_steps]
+        q = Quantity(x, dim=get_or_create_dimension(dims), copy=False)
+        setattr(rec, var, q)
+    return rec
@@ -0,0 +1,139 @@
+
+# Registry of thesis figures, to re-render only the ones whose inputs changed.
+#
+# A figure is a function that draws it (and returns the `Figure`, or leaves it as
+# the current one), declared with its inputs: data files, `cache`d functions whose
+# results it uses, and helper functions it calls. E.g., in a notebook or script:
+#
+#     @thesis_figure("input_drive_we", inputs=["data/2023-08-05__AdEx_Nto1_we_sweep.csv"])
+#     def _():
+#         df = pd.read_csv(…)
+#         fig, axs = plt.subplots(…)
+#         …
+#         return fig
+#
+# `build_figures()` then renders every registered figure of which the code, an input,
+# or the shared plot style (`plot.py`, `plotbase.py`, `rcparams.py`) changed since
+# the last build, in parallel, with `savefig_thesis`. The code of a figure is that of
+# the whole script that defines it (so that helpers defined there count too). For
+# figures defined in a notebook cell, that is just the cell: declare the helpers
+# they call (defined in other cells) as `inputs`. To rebuild from the command
+# line (from `nb/`), give the scripts that declare figures:
+#
+#     python pylib/figures.py figs/*.py
+#
+# (These scripts should `from figures import *`).
+#
+# Figure functions should load their data from files or from the disk cache, so
+# that no simulations are rerun.
+
+import hashlib
+import inspect
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+from plot import *
+from lazy import pylib_dir
+
+registry = {}  # name → SimpleNamespace(name, f, inputs)
+
+style_files = ["plot.py", "plotbase.py", "rcparams.py"]
+
+
+def thesis_figure(name, inputs = ()):
+    "Register the decorated function as the code that draws thesis figure `name`"
+    def register(f):
+        registry[name] = SimpleNamespace(name=name, f=f, inputs=list(inputs))
+        return f
+    return register
+
+
+def manifest_path():
+    return Path(thesis_figs_dir) / ".manifest.json"
+
+
+def fingerprint(fig):
+    "Hash of everything that determines how figure `fig` looks"
+    h = hashlib.blake2b(digest_size=16)
+    h.update(script_source(fig.f).encode())
+    for file in style_files:
+        h.update((pylib_dir / file).read_bytes())
+    for x in fig.inputs:
+        if callable(x):
+            # A helper, or a `cache`d function. The results of the latter are a
+            # function of its code (plus the arguments, which are in the figure code).
+            h.update(source(getattr(x, "f", x)).encode())
+        else:
+            p = Path(x)
+            st = p.stat()
+            h.update(f"{p}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+def script_source(f):
+    "Source of the file that defines function `f` (or of `f` alone, if not in a file)"
+    try:
+        file = inspect.getsourcefile(f)
+    except TypeError:
+        file = None
+    if file and Path(file).is_file():
+        return Path(file).read_text(encoding="utf-8")
+    return source(f)
+
+
+def source(f):
+    try:
+        return inspect.getsource(f)
+    except (OSError, TypeError):
+        return f.__code__.co_code.hex()
+
+
+def build_figures(names = None, force = False, n_jobs = -1):
+    """
+    Render the figures in `names` (default: all registered ones) that are missing or
+    out of date; or all of them, with `force`. Renders in `n_jobs` processes (-1: one
+    per core), if there is more than one figure to render.
+    """
+    if names is None:
+        names = list(registry)
+    path = manifest_path()
+    manifest = json.loads(path.read_text()) if path.exists() else {}
+    prints = {name: fingerprint(registry[name]) for name in names}
+    todo = [
+        name for name in names
+        if force
+        or manifest.get(name) != prints[name]
+        or not (Path(thesis_figs_dir) / f"{name}.pdf").exists()
+    ]
+    print(f"{len(names) - len(todo)} of {len(names)} figures up to date. "
+          f"Rendering {len(todo)} …")
+    if len(todo) <= 1 or n_jobs == 1:
+        durations = [render(registry[name]) for name in todo]
+    else:
+        from joblib import Parallel, delayed
+        durations = Parallel(n_jobs=n_jobs)(delayed(render)(registry[name]) for name in todo)
+    for name, t in zip(todo, durations):
+        print(f"  {name:<40} {t:5.1f} s")
+        manifest[name] = prints[name]
+    path.write_text(json.dumps(manifest, indent=1))
+
+
+def render(fig):
+    from time import perf_counter
+    t0 = perf_counter()
+    plt.close("all")
+    f = fig.f()
+    savefig_thesis(fig.name, f if f is not None else plt.gcf())
+    plt.close("all")
+    return perf_counter() - t0
+
+
+if __name__ == "__main__":
+    # (The scripts register their figures in the `figures` module, not `__main__`).
+    import runpy
+    import figures
+    for script in sys.argv[1:]:
+        runpy.run_path(script)
+    figures.build_figures()
@@ -0,0 +1,113 @@
+
+# Lazy imports of heavy dependencies, and import timings.
+#
+# `pd = lazy_import("pandas")` gives a stand-in module, that imports the real one on
+# first attribute access (e.g. `pd.DataFrame`). So scripts and worker processes that
+# never make a table do not pay for importing pandas.
+#
+# The time taken by every lazy import, and by the import of every module in this
+# directory, is recorded. See `import_report()`.
+
+import sys
+from contextlib import contextmanager
+from importlib import import_module
+from importlib.abc import Loader, MetaPathFinder
+from importlib.machinery import PathFinder
+from pathlib import Path
+from time import perf_counter
+from types import ModuleType
+
+pylib_dir = Path(__file__).resolve().parent
+
+import_times = {}  # name → seconds (including the imports it triggered)
+
+
+@contextmanager
+def timed(name, label = None):
+    "Record the time of this block under `name`; and print `importing {label} … ✔`"
+    if label:
+        print(f"importing {label}", end=" … ")
+    t0 = perf_counter()
+    yield
+    import_times[name] = perf_counter() - t0
+    if label:
+        print("✔")
+
+
+class LazyModule(ModuleType):
+
+    def __init__(self, name, label = None):
+        super().__init__(name)
+        self._label = label
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            with timed(self.__name__, self._label):
+                self._module = import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr):
+        if self._module is None and attr.startswith("__") and attr.endswith("__"):
+            # (Keeps e.g. `inspect` and pickle from triggering the import).
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded yet"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+lazy_modules = {}
+
+def lazy_import(name, label = None):
+    "Stand-in for module `name`, imported on first use"
+    if name in sys.modules:
+        return sys.modules[name]
+    if name not in lazy_modules:
+        lazy_modules[name] = LazyModule(name, label)
+    return lazy_modules[name]
+
+
+class TimedLoader(Loader):
+    "Wraps the loader of a module in this directory, to time its execution"
+
+    def __init__(self, loader):
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        with timed(module.__name__):
+            self.loader.exec_module(module)
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+
+class TimedFinder(MetaPathFinder):
+
+    def find_spec(self, name, path = None, target = None):
+        if "." in name or not (pylib_dir / f"{name}.py").exists():
+            return None
+        spec = PathFinder.find_spec(name, [str(pylib_dir)])
+        if spec is not None:
+            spec.loader = TimedLoader(spec.loader)
+        return spec
+
+if not any(isinstance(f, TimedFinder) for f in sys.meta_path):
+    sys.meta_path.insert(0, TimedFinder())
+
+
+def import_report():
+    """
+    Print how long the import of every module took (slowest first). Times include
+    the imports that a module triggered: e.g. `util` includes `plot`.
+    """
+    for name, t in sorted(import_times.items(), key=lambda x: -x[1]):
+        kind = "" if (pylib_dir / f"{name}.py").exists() else "  (dependency)"
+        print(f"{name:<20} {t:6.2f} s{kind}")
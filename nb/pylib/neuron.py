@@ -32,8 +32,16 @@ dge/dt = -ge / tau_g : siemens
 dgi/dt = -gi / tau_g : siemens
 """
 
-def COBA_AdEx_neuron(N = 1):
-    n = NeuronGroup(N, eqs, threshold="V > Vs", reset="V = Vr; w += b", method='euler')
+# Synaptic weights as model variables, instead of as external constants.
+# That way they can be changed after the code has been generated (see `standalone.py`).
+weight_eqs = """
+we : siemens (shared)
+wi : siemens (shared)
+"""
+
+def COBA_AdEx_neuron(N = 1, weights_as_vars = False):
+    model = eqs + weight_eqs if weights_as_vars else eqs
+    n = NeuronGroup(N, model, threshold="V > Vs", reset="V = Vr; w += b", method='euler')
     n.V = EL
     # Rest of vars are auto set to 0
     return n
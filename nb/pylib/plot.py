@@ -1,15 +1,19 @@
 
-print("importing mpl", end=" … ")
-import matplotlib.pyplot as plt
-print("✔")
+import sys
+from lazy import lazy_import, timed, import_report
 
-print("importing brian", end=" … ")
-from brian2.units import *
-from brian2.numpy_ import *
-print("✔")
+# (Brian imports pyplot anyway (through `pylab`), so that can't be deferred).
+with timed("matplotlib.pyplot", "mpl"):
+    import matplotlib.pyplot as plt
 
-import matplotlib_inline
-matplotlib_inline.backend_inline.set_matplotlib_formats('retina')
+with timed("brian2", "brian"):
+    from brian2.units import *
+    from brian2.numpy_ import *
+import numpy as np
+
+if "IPython" in sys.modules:
+    import matplotlib_inline
+    matplotlib_inline.backend_inline.set_matplotlib_formats('retina')
 
 from plotbase import *
 
@@ -21,13 +25,15 @@ marginwidth = mw = 0.28 * paperwidth  # From totex/Settings.tex → \marginwidth
 maintextwidth = mtw = 324 / 72        # From latexmk output → Text width
 
 
+thesis_figs_dir = "../thesis/figs"
+
 def savefig_thesis(name, fig=None):
     if fig is None:
         if len(plt.get_fignums()) == 0:
             print("No figure in gcf. Supply one as 2nd arg")
             return
         fig = plt.gcf()
-    path = f"../thesis/figs/{name}.pdf"
+    path = f"{thesis_figs_dir}/{name}.pdf"
     fig.savefig(path)
     print(f"Saved at `{path}`")
 
@@ -40,19 +46,36 @@ def plotsig(
         y_unit = 'auto',
         tlim = None,
         xlabel = 'Time',
+        dt = 0.1 * ms,
+        decimate = True,
         **kw
     ):
-    if y_unit == 'auto':
-        y_unit = max(abs(y)).get_best_unit()
-    t = timesig(y)
+    """
+    Plot signal `y`, sampled every `dt`, in the time range `tlim`.
+
+    With `decimate`, long signals are reduced to the min and max sample per fraction
+    of a pixel column (so that they look the same, peaks included), and this is
+    redone when zooming in. Only the shown part of `y` is read (which matters for memory-mapped
+    signals; see `diskmonitor.py`).
+    """
+    N = y.size
     if tlim is None:
-        t0, t1 = t[0], t[-1]
+        t0, t1 = 0 * second, (N - 1) * dt
     else:
         t0, t1 = tlim
-    shown = (t >= t0) & (t <= t1)
-    x_ = t[shown] / t_unit
-    y_ = y[shown] / y_unit
-    ax = plot(x_, y_, xunit=t_unit, yunit=y_unit, **kw)
+    i0, i1 = shown_range(t0, t1, dt, N)
+    if y_unit == 'auto':
+        # (From the whole signal if `tlim` is outside it).
+        shown = y[i0:i1] if i1 > i0 else y
+        y_unit = abs(shown).max().get_best_unit()
+    if "ax" not in kw or kw["ax"] is None:
+        _, kw["ax"] = plt.subplots(figsize=kw.pop("fs", (4, 2.4)))
+    ax = kw["ax"]
+    yv = np.asarray(y)
+    scale_t = float(dt / t_unit)
+    scale_y = 1 / float(y_unit)
+    x_, y_ = minmax_decimate(yv, i0, i1, num_bins(ax) if decimate else None)
+    ax = plot(x_ * scale_t, y_ * scale_y, xunit=t_unit, yunit=y_unit, **kw)
     if ylabel is not None:
         if hylab:
             hylabel(ax, ylabel)
@@ -60,9 +83,124 @@ def plotsig(
             ax.set_ylabel(ylabel)
     ax.set_xlim([t0, t1] / t_unit)
     ax.set_xlabel(xlabel)
+    if decimate:
+        line = ax.lines[-1]
+        def redecimate(ax):
+            lo, hi = ax.get_xlim()
+            i0, i1 = shown_range(lo * t_unit, hi * t_unit, dt, N)
+            x_, y_ = minmax_decimate(yv, i0, i1, num_bins(ax))
+            line.set_data(x_ * scale_t, y_ * scale_y)
+        ax.callbacks.connect("xlim_changed", redecimate)
     return ax
 
 
+def shown_range(t0, t1, dt, N):
+    "Sample indices [i0, i1) of the samples in [t0, t1]"
+    i0 = max(int(np.ceil(float(t0 / dt) - 1e-9)), 0)
+    i1 = min(int(np.floor(float(t1 / dt) + 1e-9)) + 1, N)
+    return i0, max(i0, i1)
+
+
+def num_bins(ax):
+    """
+    Number of bins for `minmax_decimate`: a few per pixel column of `ax` (also on
+    high-dpi displays), so that line antialiasing looks the same too.
+    """
+    return 4 * int(ax.bbox.width)
+
+
+def minmax_decimate(y, i0, i1, num_bins = None):
+    """
+    Sample indices and values of `y[i0:i1]`; or, if that has more than `2·num_bins`
+    samples, of only the min and max of each of `num_bins` equal-length parts of it.
+    """
+    n = i1 - i0
+    if num_bins is None or n <= 2 * num_bins:
+        return np.arange(i0, i1), y[i0:i1]
+    k = -(-n // num_bins)  # Samples per bin (ceil)
+    num_full = n // k
+    blocks = np.asarray(y[i0 : i0 + num_full * k]).reshape(num_full, k)
+    starts = i0 + k * np.arange(num_full)
+    imin = starts + blocks.argmin(axis=1)
+    imax = starts + blocks.argmax(axis=1)
+    ix = np.stack([np.minimum(imin, imax), np.maximum(imin, imax)], axis=1).ravel()
+    if num_full * k < n:  # Last, partial bin
+        rest = np.asarray(y[i0 + num_full * k : i1])
+        j = i0 + num_full * k
+        ix = np.concatenate([ix, sorted([j + rest.argmin(), j + rest.argmax()])])
+    return ix, y[ix]
+
+
+def rasterplot(
+        spikes,
+        tlim = None,
+        t_unit = second,
+        method = "auto",
+        max_markers = 50_000,
+        ms = 3,
+        color = "k",
+        ax = None,
+        fs = (4, 2.4),
+        xlabel = "Time",
+        ylabel = "Neuron number",
+        **kw
+    ):
+    """
+    Spike raster of a `SpikeMonitor`, a `SpikeStore`, or an `(i, t)` tuple (neuron
+    index and time of every spike; `t` as a Quantity or in seconds).
+
+    `method`:
+    - "markers": one dot per spike, all in a single artist (which a PDF stores as one
+      marker shape, plus a position per spike);
+    - "image": a (rasterized) image, with the number of spikes per pixel;
+    - "auto": "markers" up to `max_markers` spikes in `tlim`, "image" above.
+    Other keyword arguments go to `sett`.
+    """
+    i, t, N = spike_arrays(spikes)
+    if tlim is None:
+        t0, t1 = 0, t.max() if len(t) else 1
+    else:
+        t0, t1 = (float(x / second) for x in tlim)
+    shown = (t >= t0) & (t <= t1)
+    i, t = i[shown], t[shown]
+    if ax is None:
+        _, ax = plt.subplots(figsize=fs)
+    scale = float(second / t_unit)
+    if method == "auto":
+        method = "markers" if len(t) <= max_markers else "image"
+    if method == "markers":
+        ax.plot(t * scale, i, ".", ms=ms, color=color, ls="none", clip_on=False)
+    else:
+        # Pixel rows: one per neuron, unless there are more neurons than pixels.
+        w, h = int(2 * ax.bbox.width), int(2 * ax.bbox.height)
+        counts, _, _ = np.histogram2d(i, t, bins=[min(N, h), w], range=[[0, N], [t0, t1]])
+        nonzero = counts[counts > 0]
+        vmax = np.percentile(nonzero, 99) if len(nonzero) else 1
+        cmap = mpl.colors.LinearSegmentedColormap.from_list("", ["white", color])
+        ax.imshow(counts, extent=[t0 * scale, t1 * scale, 0, N], origin="lower",
+                  aspect="auto", interpolation="nearest", cmap=cmap, vmin=0,
+                  vmax=vmax, rasterized=True)
+    sett(ax, xunit=t_unit, xlabel=xlabel, ylabel=ylabel, **kw)
+    ax.set_xlim(t0 * scale, t1 * scale)
+    if "ylim" not in kw:
+        ax.set_ylim(0, N)
+    return ax
+
+
+def spike_arrays(spikes):
+    "Neuron index and time (in seconds) of every spike, and the number of neurons"
+    if hasattr(spikes, "offsets"):  # A `SpikeStore`
+        return spikes.neuron_ids, spikes.steps * spikes.dt, len(spikes)
+    if hasattr(spikes, "source"):  # A `SpikeMonitor`
+        i = spikes.variables["i"].get_value()
+        t = spikes.variables["t"].get_value()
+        return np.asarray(i), np.asarray(t), len(spikes.source)
+    i, t = spikes
+    i = np.asarray(i)
+    t = np.asarray(t / second if hasattr(t, "dim") else t)
+    return i, t, i.max() + 1 if len(i) else 0
+
+
 def timesig(y, dt=0.1*ms, t0=0 * second):
     N = y.size
     T = N * dt
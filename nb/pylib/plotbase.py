@@ -1,6 +1,7 @@
 
 import matplotlib.pyplot as plt
 import matplotlib as mpl
+import numpy as np
 
 import brian2
 
@@ -20,12 +21,12 @@ def plot(*args, ax = None, fs = (4, 2.4), **kw):
 
     xunit = best_unit(x)
     if xunit is not None and "xunit" not in kw:
-        args[0] = [xi / xunit for xi in x]
+        args[0] = in_unit(x, xunit)
         kw["xunit"] = xunit
 
     yunit = best_unit(y)
     if yunit is not None and "yunit" not in kw:
-        args[1] = [yi / yunit for yi in y]
+        args[1] = in_unit(y, yunit)
         kw["yunit"] = yunit
 
     plotkw = {k: v for (k, v) in kw.items()
@@ -37,6 +38,15 @@ def plot(*args, ax = None, fs = (4, 2.4), **kw):
 
 
 def best_unit(x):
+    "Best unit for the largest value in `x`. None if `x` has no units."
+    if isinstance(x, brian2.Quantity):
+        # Fast path: one Quantity array, so one unit for all elements.
+        if x.size == 0 or x.is_dimensionless:
+            return None if x.size == 0 else brian2.Unit(1)
+        xmax = np.abs(np.asarray(x)).max()
+        return brian2.Quantity(xmax, dim=x.dim).get_best_unit()
+    if isinstance(x, np.ndarray) and x.dtype != object:
+        return None
     xmax = max([abs(xi) for xi in x])
     if type(xmax) == brian2.Quantity:
         return xmax.get_best_unit()
@@ -44,6 +54,13 @@ def best_unit(x):
         return None
 
 
+def in_unit(x, unit):
+    "Values of `x` in the given unit, as a plain array"
+    if isinstance(x, brian2.Quantity):
+        return np.asarray(x) / float(unit)
+    return [xi / unit for xi in x]
+
+
 def sett(
         ax,
         xtype = "default",
@@ -0,0 +1,139 @@
+
+# Compact storage for the spikes of many neurons (e.g. all 6500 inputs of `Nto1`),
+# in 'compressed sparse row' layout: one array with the spike times of all neurons,
+# sorted by neuron and then by time, plus per-neuron offsets into that array.
+# Times are stored as int32 timestep indices: the step that a spike falls in (see
+# `to_steps`).
+#
+# Usage:
+#
+#     s = SpikeStore.from_monitor(SP)
+#     s[12]            # Spike times of neuron 12 (in seconds)
+#     s.rates          # Firing rates of all neurons (in Hz)
+#
+# As in `Nto1_numpy`, times and rates are plain floats in SI units.
+
+import numpy as np
+
+
+def to_steps(t, dt):
+    """
+    Index of the timestep that each time falls in: floor(t / dt). (Plus a small
+    tolerance, so that on-grid times, such as Brian's, are not rounded down a step
+    by float error).
+    """
+    return np.floor(np.asarray(t) / float(dt) + 1e-6).astype(np.int64)
+
+
+class SpikeStore:
+
+    def __init__(self, steps, offsets, dt, duration):
+        self.steps = steps        # int32, length = total number of spikes
+        self.offsets = offsets    # int64, length = N + 1
+        self.dt = dt              # In seconds
+        self.duration = duration  # In seconds
+
+    @classmethod
+    def from_arrays(cls, i, t, dt, duration, N = None):
+        """
+        From the `i` and `t` arrays of a `SpikeMonitor` (or similar: neuron index and
+        spike time per spike, the latter as a Quantity or in seconds).
+        """
+        # (Quantities are arrays of values in SI units: no need to import Brian).
+        i = np.asarray(i)
+        t = np.asarray(t)
+        dt = float(dt)
+        duration = float(duration)
+        if N is None:
+            N = i.max() + 1 if len(i) else 0
+        order = np.lexsort((t, i))
+        steps = to_steps(t[order], dt).astype(np.int32)
+        counts = np.bincount(i, minlength=N)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return cls(steps, offsets, dt, duration)
+
+    @classmethod
+    def from_monitor(cls, S, duration = None):
+        "Duration defaults to the current simulation time of the monitor's clock."
+        if duration is None:
+            duration = S.clock.t[:]
+        return cls.from_arrays(
+            S.variables["i"].get_value(),
+            S.variables["t"].get_value(),
+            S.clock.dt,
+            duration,
+            N = len(S.source),
+        )
+
+    @classmethod
+    def from_trains(cls, trains, dt, duration):
+        "From a list of spike time arrays (in seconds), one per neuron"
+        i = np.repeat(np.arange(len(trains)), [len(t) for t in trains])
+        t = np.concatenate(trains) if trains else np.array([])
+        return cls.from_arrays(i, t, dt, duration, N = len(trains))
+
+    @classmethod
+    def from_npz(cls, path, dt, duration):
+        "From an `.npz` file with one `neuron_{j}` array per neuron (see `to_dict`)"
+        f = np.load(path)
+        N = len([k for k in f.keys() if k.startswith("neuron_")])
+        return cls.from_trains([f[f"neuron_{j}"] for j in range(N)], dt, duration)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def steps_of(self, j):
+        "Spike times of neuron `j`, as timestep indices (a view, no copy)"
+        return self.steps[self.offsets[j] : self.offsets[j+1]]
+
+    def __getitem__(self, j):
+        return self.steps_of(j) * self.dt
+
+    def __iter__(self):
+        return (self[j] for j in range(len(self)))
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def rates(self):
+        return self.counts / self.duration
+
+    @property
+    def neuron_ids(self):
+        "Neuron index of every spike in `steps`"
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    def counts_between(self, t0, t1):
+        "Number of spikes of every neuron in [t0, t1) (in seconds)"
+        # Make `steps` globally sorted, by adding a per-neuron offset larger than any
+        # step. Then one `searchsorted` gives the window bounds for all neurons.
+        max_step = max(round(self.duration / self.dt), self.steps.max(initial=0))
+        stride = np.int64(max_step + 2)
+        keys = self.neuron_ids * stride + self.steps
+        base = np.arange(len(self)) * stride
+        # (Clipped, so that windows beyond [0, duration] do not reach into the keys of
+        # the previous or next neuron).
+        s0 = np.clip(np.ceil(t0 / self.dt), 0, stride - 1)
+        s1 = np.clip(np.ceil(t1 / self.dt), 0, stride - 1)
+        lo = np.searchsorted(keys, base + s0)
+        hi = np.searchsorted(keys, base + s1)
+        return hi - lo
+
+    def to_dict(self):
+        "As in `data/2024-07-01__AdExNet-Brian/spiketimes.npz`"
+        return {f"neuron_{j}": self[j] for j in range(len(self))}
+
+    def save(self, path):
+        np.savez(path, steps=self.steps, offsets=self.offsets,
+                 dt=self.dt, duration=self.duration)
+
+    @classmethod
+    def load(cls, path):
+        f = np.load(path)
+        return cls(f["steps"], f["offsets"], float(f["dt"]), float(f["duration"]))
+
+    def __repr__(self):
+        return (f"SpikeStore({len(self)} neurons, {len(self.steps)} spikes, "
+                f"{self.duration:g} s)")
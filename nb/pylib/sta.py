@@ -0,0 +1,287 @@
+
+# Spike-triggered averages (STAs) of a voltage trace, for many spike trains at once.
+#
+# Same definition as `calc_STA` in ConnectionTests.jl: windows start at the sample of
+# each spike, and windows that do not fit in the signal are skipped.
+#
+# Instead of one STA per call, we compute all of them as one matrix product:
+#
+#     STAs = A @ H / num_wins
+#
+# where A is a sparse (num_trains × num_samples) spike-count matrix, and H the
+# (num_samples × win_size) matrix of all windows of `v` (H[t, k] = v[t + k]).
+# H is never built in full: we go over it in blocks of time.
+#
+# Times (`Δt`) are in seconds, or Quantities. Brian is not needed (nor imported),
+# unless given Quantities.
+
+from types import SimpleNamespace
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.sparse import csr_matrix
+
+from spikestore import to_steps
+
+
+def calc_STAs(v, trains, Δt = 0.1e-3, win_size = 1000, block = 10_000):
+    """
+    STAs of signal `v` for every spike train in `trains`.
+
+    `v`: a 1D array (e.g. `out.V`), or Quantity.
+    `trains`: a list of spike time arrays (in seconds; e.g. `out.trains`), or a
+        `SpikeStore`.
+    `win_size`: STA length, in samples (default 1000 = 100 ms at 0.1 ms Δt).
+
+    Returns a (num_trains × win_size) array (with the units of `v`, if any).
+    Trains without any (complete) window get an all-NaN STA.
+    """
+    v, unit = strip_units(v)
+    A = spike_matrix(trains, len(v) - win_size + 1, Δt)
+    STAs = windowed_product(A, v, win_size, block)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        STAs /= np.asarray(A.sum(axis=1))
+    return with_unit(STAs, unit)
+
+
+def spike_matrix(trains, num_cols, Δt = 0.1e-3):
+    """
+    Sparse (num_trains × num_cols) matrix with, at [j, a], the number of spikes of
+    train j that fall in sample a. Spikes beyond `num_cols` are dropped.
+    """
+    rows, cols = spike_indices(trains, Δt)
+    return count_matrix(rows, cols, len(trains), num_cols)
+
+
+def count_matrix(rows, cols, num_rows, num_cols):
+    keep = cols < num_cols
+    rows, cols = rows[keep], cols[keep]
+    return csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_rows, num_cols))
+
+
+def spike_indices(trains, Δt = 0.1e-3):
+    "Train index and sample index of every spike"
+    dt = float(Δt)
+    if hasattr(trains, "offsets"):  # A `SpikeStore`
+        rows = trains.neuron_ids
+        if np.isclose(trains.dt, dt):
+            cols = trains.steps.astype(np.int64)
+        else:
+            cols = to_steps(trains.steps * trains.dt, dt)
+    else:
+        rows = np.repeat(np.arange(len(trains)), [len(t) for t in trains])
+        times = np.concatenate(trains) if len(trains) else np.array([])
+        cols = to_steps(times, dt)
+    return rows, cols
+
+
+def windowed_product(A, v, win_size, block = 10_000):
+    "`A @ H`, with H[t, k] = v[t + k]. (Without building all of H)."
+    A = A.tocsc()
+    H = sliding_window_view(v, win_size)
+    out = np.zeros((A.shape[0], win_size))
+    for t0 in range(0, A.shape[1], block):
+        Ab = A[:, t0 : t0 + block]
+        if Ab.nnz > 0:
+            out += Ab @ np.ascontiguousarray(H[t0 : t0 + block])
+    return out
+
+
+def strip_units(x):
+    "Plain array, and dimensions (or None)"
+    if hasattr(x, "dim"):  # A Quantity
+        return np.asarray(x), x.dim
+    return np.asarray(x, dtype=float), None
+
+
+def with_unit(x, dim):
+    if dim is None:
+        return x
+    from brian2 import Quantity
+    return Quantity(x, dim=dim)
+
+
+# -- Multiple window lengths --
+#
+# An STA of length w (at offset o) is a slice [o : o+w] of a longer STA, except for
+# spikes near the end of the signal: their long windows do not fit, while shorter
+# ones might. We therefore sum the long windows of all other spikes in one pass, and
+# keep the (few) windows of these end spikes separately. Any shorter STA can then be
+# derived without going over `v` again.
+
+class MultiWinSTAs:
+    """
+    STAs for every window length (and offset) up to `max_win`, from one pass over
+    `v`. Index with a window length, or use `window(win_size, offset)`:
+
+        m = MultiWinSTAs(v, trains, 1000)
+        m[200]                          # Same as `calc_STAs(v, trains, win_size=200)`
+        m.window(200, offset=100)
+        m.windows([100, 200, 500])      # Dict, win_size → STAs
+    """
+
+    def __init__(self, v, trains, max_win = 1000, Δt = 0.1e-3, block = 10_000):
+        v, self.unit = strip_units(v)
+        self.max_win = max_win
+        self.num_trains = len(trains)
+        rows, cols = spike_indices(trains, Δt)
+        inrange = cols < len(v)
+        rows, cols = rows[inrange], cols[inrange]
+        num_full = len(v) - max_win + 1
+        full = cols < num_full
+        A = count_matrix(rows[full], cols[full], self.num_trains, num_full)
+        self.sums = windowed_product(A, v, max_win, block)
+        self.counts = np.asarray(A.sum(axis=1)).ravel()
+        # Spikes whose long window runs past the end of `v`:
+        self.end_rows = rows[~full]
+        self.end_room = len(v) - cols[~full]  # Longest window that fits
+        padded = np.concatenate([v, np.full(max_win, np.nan)])
+        self.end_wins = padded[cols[~full, np.newaxis] + np.arange(max_win)]
+
+    def window(self, win_size, offset = 0):
+        "STAs of length `win_size`, with windows starting `offset` samples after spikes"
+        if offset + win_size > self.max_win:
+            raise ValueError(f"offset + win_size must be ≤ max_win ({self.max_win})")
+        sums = self.sums[:, offset : offset + win_size].copy()
+        counts = self.counts.astype(float)
+        fits = self.end_room >= offset + win_size
+        np.add.at(sums, self.end_rows[fits], self.end_wins[fits, offset : offset + win_size])
+        counts += np.bincount(self.end_rows[fits], minlength=self.num_trains)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            STAs = sums / counts[:, np.newaxis]
+        return with_unit(STAs, self.unit)
+
+    def __getitem__(self, win_size):
+        return self.window(win_size)
+
+    def windows(self, win_sizes, offset = 0):
+        return {w: self.window(w, offset) for w in win_sizes}
+
+
+# -- Shuffle test --
+#
+# As `calc_shuffle_STAs` & `calc_pval` in ConnectionTests.jl: the null distribution
+# of a test statistic is estimated from STAs of ISI-shuffled versions of each spike
+# train. Here, the real and all shuffled trains of a batch of inputs are rows of
+# one sparse matrix, so the windows of `v` are only built once per batch, for all
+# of them.
+
+def shuffle_test(
+        v,
+        trains,
+        template = None,
+        num_shuffles = 100,
+        seed = 1,
+        Δt = 0.1e-3,
+        win_size = 1000,
+        batch = 100,
+        keep_shuffled = False,
+    ):
+    """
+    STA-based connection test for every spike train in `trains`.
+
+    Returns a namespace with, per train:
+    - `STAs`: the real STAs;
+    - `p_height`, `t_height`: p-value of the STA height (peak-to-peak) under the
+      shuffle null, and the signed connectedness of `STAHeight`;
+    - `p_corr`, `t_corr`: the same for `TemplateCorr`, if a `template` is given;
+    - `shuffled`: (num_trains × num_shuffles × win_size) STAs, if `keep_shuffled`.
+    """
+    v, unit = strip_units(v)
+    if template is not None:
+        template, _ = strip_units(template)
+    rng = np.random.default_rng(seed)
+    N = len(trains)
+    num_cols = len(v) - win_size + 1
+    STAs = np.empty((N, win_size))
+    height_null = np.empty((N, num_shuffles))
+    corr_real = np.empty(N)
+    corr_null = np.empty((N, num_shuffles))
+    shuffled = np.empty((N, num_shuffles, win_size)) if keep_shuffled else None
+    for j0 in range(0, N, batch):
+        b = train_list(trains, range(j0, min(j0 + batch, N)))
+        n = len(b)
+        rows, cols = spike_indices(b, Δt)
+        s_rows, s_times = shuffle_ISIs(b, num_shuffles, rng)
+        s_cols = to_steps(s_times, Δt)
+        A = count_matrix(
+            np.concatenate([rows, n + s_rows]),
+            np.concatenate([cols, s_cols]),
+            n * (1 + num_shuffles),
+            num_cols,
+        )
+        X = windowed_product(A, v, win_size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            X /= np.asarray(A.sum(axis=1))
+        real = X[:n]
+        shuf = X[n:].reshape(n, num_shuffles, win_size)
+        STAs[j0 : j0+n] = real
+        height_null[j0 : j0+n] = height(shuf)
+        if template is not None:
+            corr_real[j0 : j0+n] = corr(real, template)
+            corr_null[j0 : j0+n] = corr(shuf, template)
+        if keep_shuffled:
+            shuffled[j0 : j0+n] = shuf
+    p_height = pval(height(STAs), height_null)
+    out = SimpleNamespace(
+        STAs     = with_unit(STAs, unit),
+        p_height = p_height,
+        t_height = np.sign(area_over_start(STAs)) * (1 - p_height),
+    )
+    if template is not None:
+        # Test statistic is the correlation, sign-flipped if the real one is negative.
+        s = np.sign(corr_real)
+        out.p_corr = pval(s * corr_real, s[:, np.newaxis] * corr_null)
+        out.t_corr = s * (1 - out.p_corr)
+    if keep_shuffled:
+        out.shuffled = with_unit(shuffled, unit)
+    return out
+
+
+def shuffle_ISIs(trains, num_shuffles, rng):
+    """
+    `num_shuffles` ISI-shuffled versions of every train, all generated at once.
+    Returns the row (j * num_shuffles + m, for shuffle m of train j) and time of
+    every shuffled spike.
+    """
+    lens = np.repeat([len(t) for t in trains], num_shuffles)
+    ISIs = [np.tile(np.diff(t, prepend=0), num_shuffles) for t in trains]
+    ISIs = np.concatenate(ISIs) if ISIs else np.array([])
+    rows = np.repeat(np.arange(len(lens)), lens)
+    # Shuffle within each row: sort by row, then by a random key.
+    ISIs = ISIs[np.lexsort((rng.random(len(ISIs)), rows))]
+    # Cumulative sum within each row.
+    cs = np.concatenate([[0], np.cumsum(ISIs)])
+    row_starts = np.cumsum(lens) - lens
+    times = cs[1:] - np.repeat(cs[row_starts], lens)
+    return rows, times
+
+
+def train_list(trains, js):
+    "Spike times (in seconds) of trains `js`"
+    return [np.asarray(trains[j]) for j in js]
+
+
+def height(STA):
+    "aka ptp, peak-to-peak"
+    return STA.max(axis=-1) - STA.min(axis=-1)
+
+
+def area_over_start(STA):
+    return (STA - STA[..., :1]).sum(axis=-1)
+
+
+def corr(STA, template):
+    "Pearson correlation of every STA with the template"
+    x = STA - STA.mean(axis=-1, keepdims=True)
+    y = template - template.mean()
+    return (x @ y) / (np.linalg.norm(x, axis=-1) * np.linalg.norm(y))
+
+
+def pval(real, null):
+    """
+    Fraction of null values ≥ the real one ('at least as extreme').
+    When there are none, 1 / num_null (i.e. "p < 1/N").
+    """
+    num_larger = (null >= real[:, np.newaxis]).sum(axis=1)
+    return np.maximum(num_larger, 1) / null.shape[1]
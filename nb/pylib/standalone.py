@@ -0,0 +1,113 @@
+
+# Compile the N-to-1 network once (in Brian's C++ standalone mode), and rerun the
+# binary with different parameters, without generating or compiling code again.
+#
+# (See `2023-08-02__speedtest_brian_standalone_AdEx_Nto1`: `main` runs in < 1 s,
+# but a `device.reinit()` + codegen + compile per parameter set takes 5–15 s).
+#
+# Run-time parameters:
+# - wₑ, wᵢ and input rates: as Brian `run_args` (needs Brian ≥ 2.6).
+# - seed and duration T: through environment variables, read by C++ code we insert
+#   in `main`. T is simulated as a number of fixed-length chunks.
+#
+# Usage:
+#
+#     r = Nto1Standalone(N=6500, n_tracked=200)
+#     for wₑ in wₑs:
+#         r.run(wₑ, 4 * wₑ, seed=1, T=10*second)
+#         plotsig(r.M.V[0])
+
+import numpy as np
+
+from Nto1 import *
+from time import time  # (after the star import, which brings a `time` module)
+
+seed_var = "NTO1_SEED"
+num_chunks_var = "NTO1_NUM_CHUNKS"
+
+
+class Nto1Standalone:
+    """
+    Builds the network in standalone mode, then switches the process back to Brian's
+    runtime device, so that other simulations in the same notebook run as usual.
+    The standalone device is kept in `self.device`, for `run`.
+    """
+
+    def __init__(
+            self,
+            directory = "cpp/Nto1",
+            chunk = 100 * ms,
+            **Nto1_kw,
+        ):
+        set_device("cpp_standalone", directory=directory, build_on_run=False)
+        device.reinit()
+        device.activate(directory=directory, build_on_run=False)
+        self.chunk = chunk
+        self.objs = Nto1(**Nto1_kw, weights_as_vars=True)
+        self.n, self.P = self.objs[0], self.objs[1]
+        self.M, self.S, self.SP = self.objs[-4:-1]
+        net = self.objs[-1]
+        device.apply_run_args()
+        device.insert_code("main", seed_code())
+        device.insert_code("main", f"for (int _chunk=0; _chunk<{chunk_count_code()}; _chunk++) {{")
+        net.run(chunk)
+        device.insert_code("main", "}")
+        t0 = time()
+        device.build(run=False)
+        print(f"Built in {time() - t0:.1f} s")
+        self.device = get_device()
+        set_device("runtime")
+
+    def run(
+            self,
+            we,
+            wi,
+            seed,
+            T = 10 * second,
+            rates = None,
+            results_dir = None,
+        ):
+        """
+        Run the compiled network. Monitor contents can then be read as usual, from
+        `self.M`, `self.S`, and `self.SP`.
+
+        If no input `rates` are given, they are drawn from the same lognormal
+        distribution as in `Nto1`, seeded by `seed`.
+        """
+        num_chunks = T / self.chunk
+        if abs(num_chunks - round(num_chunks)) > 1e-9:
+            raise ValueError(f"T ({T}) must be a multiple of `chunk` ({self.chunk})")
+        if rates is None:
+            rng = np.random.default_rng(seed)
+            rates = rng.lognormal(μ, σ, len(self.P)) * Hz
+        if results_dir is None:
+            # Separate results dir per parameter set, so that runs can be in parallel.
+            results_dir = f"results/{we/pS:g}pS_{wi/pS:g}pS_seed{seed}_{T/second:g}s"
+        self.device.run_environment_variables[seed_var] = str(seed)
+        self.device.run_environment_variables[num_chunks_var] = str(round(num_chunks))
+        self.device.run(
+            results_directory = results_dir,
+            run_args = {self.n.we: we, self.n.wi: wi, self.P.rates: rates},
+            with_output = False,
+        )
+        # Brian remembers the shape of 2D monitor arrays from the previous read, and
+        # only knows how to grow it from 0. Reset it, so runs with a different T can
+        # be read.
+        for var in self.M.variables.values():
+            if getattr(var, "ndim", 1) == 2 and var.dynamic:
+                var.size = (0, var.size[1])
+        print(f"Ran in {self.device.timers['run_binary']:.2f} s")
+
+
+def seed_code():
+    # Same as what Brian generates for `seed(s)`, but with `s` known at run time.
+    num_threads = max(prefs.devices.cpp_standalone.openmp_threads, 1)
+    return f"""
+    if (const char* _s = std::getenv("{seed_var}"))
+        for (int _i=0; _i<{num_threads}; _i++)
+            rk_seed(std::strtoul(_s, NULL, 10) + _i, brian::_mersenne_twister_states[_i]);
+    """
+
+def chunk_count_code():
+    return f'std::atoi(std::getenv("{num_chunks_var}"))'
+
@@ -1,10 +1,9 @@
 
 from plot import *
 from brian2.numpy_ import *
+import numpy as np
 
-print("importing pandas", end=" … ")
-import pandas as pd
-print("✔")
+pd = lazy_import("pandas", "pandas")
 
 pS = psiemens
 minute = 60 * second
@@ -23,18 +22,115 @@ def ceil_spikes(V, t, spiketimes, V_ceil=Vs):
     V[i] = V_ceil
     return V
 
-from collections import Counter
+from brian2.units.fundamentalunits import (
+    DIMENSIONLESS, DimensionMismatchError, get_or_create_dimension,
+    standard_unit_register, user_unit_register, additional_unit_register,
+)
+unit_registers = [standard_unit_register, user_unit_register, additional_unit_register]
 
 def units_to_header(df):
+    """
+    Divide columns of Quantities by their most fitting unit, and add that unit to the
+    column name (e.g. `we` → `we_pS`).
+    """
     df = df.copy()
     for col in df:
         x = df[col].values[-1]
         if type(x) == Quantity:
-            c = Counter(el.get_best_unit() for el in df[col])
-            unit = c.most_common()[0][0]
-            df[col] = [val / unit for val in df[col]]
+            values, dim = quantity_column(df[col])
+            unit = common_unit(values, dim)
+            df[col] = values / float(unit)
             df[col].unit = unit
             df.rename(columns={col: f"{col}_{unit}"}, inplace=True)
         else:
             df[col].unit = None
     return df
+
+
+def quantity_column(col):
+    "Values (in SI units) and dimensions of a column of scalar Quantities"
+    x = col.values if hasattr(col, "values") else col
+    dims = {getattr(el, "dim", DIMENSIONLESS) for el in x}
+    if len(dims) > 1:
+        raise DimensionMismatchError(f"Column with mixed units: {dims}")
+    return np.asarray(x, dtype=float), dims.pop()
+
+
+def common_unit(values, dim):
+    """
+    The unit that `get_best_unit` gives for most of the given values (in SI units,
+    with dimensions `dim`). Same result as calling it on every value, but for all of
+    them at once.
+    """
+    if dim is DIMENSIONLESS:
+        return Unit(1)
+    for reg in unit_registers:
+        matching = reg.units_for_dimensions.get(dim, {})
+        if matching:
+            break
+    else:
+        return Quantity(1, dim)
+    scales = np.asarray(list(matching.keys()))
+    units = list(matching.values())
+    with np.errstate(divide="ignore"):
+        dev = (np.log10(np.abs(values)[:, np.newaxis] / scales) - 1) ** 2
+    best = dev.argmin(axis=1)
+    best[values == 0] = list(matching).index(1.0)  # Zeros: base unit
+    counts = np.bincount(best, minlength=len(units))
+    # On a tie, the unit that occurs first (as `Counter.most_common` does).
+    tied = np.flatnonzero(counts == counts.max())
+    first = min(tied, key=lambda u: np.argmax(best == u))
+    return units[first]
+
+
+import json
+
+# Result tables in Parquet format, with the unit of each column stored in the
+# column's metadata. Columns of Quantities are stored as floats in their
+# `common_unit`. On reading, the units are in `df.attrs["units"]`; see `col_q`.
+
+def write_table(df, path):
+    "Save `df` (which may have columns of Quantities) as a Parquet file"
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    df = df.copy()
+    units = {}
+    for col in df:
+        if len(df[col]) and isinstance(df[col].values[0], Quantity):
+            values, dim = quantity_column(df[col])
+            unit = common_unit(values, dim)
+            df[col] = values / float(unit)
+            units[col] = unit
+    table = pa.Table.from_pandas(df)
+    fields = [
+        f.with_metadata({"unit": unit_meta(units[f.name])}) if f.name in units else f
+        for f in table.schema
+    ]
+    pq.write_table(table.cast(pa.schema(fields, metadata=table.schema.metadata)), path)
+
+def read_table(path, columns=None):
+    "Load a table saved with `write_table`. Columns are floats; see `col_q`."
+    import pyarrow.parquet as pq
+    table = pq.read_table(path, columns=columns)
+    df = table.to_pandas()
+    df.attrs["units"] = {
+        f.name: parse_unit_meta(f.metadata[b"unit"])
+        for f in table.schema if f.metadata and b"unit" in f.metadata
+    }
+    return df
+
+def col_q(df, col):
+    "Column `col` of a table from `read_table`, as a Quantity array"
+    return df[col].values * df.attrs["units"][col]
+
+def unit_meta(unit):
+    return json.dumps(dict(name=str(unit), scale=float(unit), dims=unit.dim._dims))
+
+def parse_unit_meta(meta):
+    d = json.loads(meta)
+    dim = get_or_create_dimension(d["dims"])
+    for reg in unit_registers:
+        for unit in reg.units_for_dimensions.get(dim, {}).values():
+            if str(unit) == d["name"]:
+                return unit
+    return Quantity(d["scale"], dim=dim)
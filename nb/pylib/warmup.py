@@ -0,0 +1,120 @@
+
+# Generate and compile, ahead of time, all the (Cython) code that our networks need.
+#
+# Brian caches compiled code objects on disk (in `~/.cython/brian_extensions`), keyed
+# by their code. Group sizes and most parameter values are not part of that code; but
+# the number of merged inputs `N` and the probability `p` of a `PoissonInput` are
+# (they are written into its binomial sampling code as literals). Object names are
+# in the code too; and these get numbered (`neurongroup_1`, …) when a process builds
+# more than one network. So one short run of each variant of our networks, at the
+# sizes (`N`, `n_tracked`) of the real runs, and each in a fresh process, compiles
+# everything that the first network of a real process needs. (Warming up on some
+# other, toy network does not help: see `2023-07-10__AdEx_Nto1_Brian_speedtest`).
+#
+# Usage, e.g. when setting up a fresh machine or container:
+#
+#     python warmup.py
+#
+# or, in a notebook: `from warmup import warm_up` (or `import pylib`), and
+# `warm_up()`.
+
+import os
+from contextlib import contextmanager
+from importlib import import_module
+from multiprocessing import get_context
+from types import SimpleNamespace
+
+from Nto1 import *
+from time import time  # (after the star import, which brings a `time` module)
+from brian2.codegen.runtime.cython_rt.extension_manager import get_cython_cache_dir
+
+
+def warm_up(
+        vars_to_record = [["V"], ["V", "w", "ge", "gi"]],
+        n_tracked = [None, 200],
+        weights_as_vars = [False, True],
+        Ns = [6500],
+    ):
+    """
+    Build and run (for one timestep) `Nto1` in every combination of the given
+    options: network sizes `Ns`; all inputs separate and with the merged
+    `PoissonInput`s (`n_tracked`); weights as constants and as model variables; and
+    the given monitor variables. This covers all code objects of `COBA_AdEx_neuron`,
+    both synapse types, the `PoissonInput`s, and the monitors. The `PoissonInput`
+    code is specific to the number of merged inputs: give the `Ns` and `n_tracked`
+    of the runs to warm up for.
+
+    Prints what was compiled (and what was already in the cache), with timings.
+    Returns the list of code objects, with `config`, `name`, `duration` (in
+    seconds), and `compiled` (False if it was loaded from the cache).
+    """
+    configs = [
+        dict(N=N, vars_to_record=v, n_tracked=n, weights_as_vars=w)
+        for N in Ns
+        for v in vars_to_record
+        for n in n_tracked
+        for w in weights_as_vars
+    ]
+    print(f"Code target: {prefs.codegen.target}. Cache: {get_cython_cache_dir()}")
+    log = []
+    t0 = time()
+    for config in configs:
+        print(config)
+        # (A new process per network, so that all get the names of a first network.
+        # The function is sent by reference, so take it from the importable module:
+        # under `python warmup.py` or `%run`, this one is `__main__`'s copy).
+        with get_context("spawn").Pool(1) as pool:
+            objs = pool.apply(import_module("warmup").build_and_run, (config,))
+        for o in objs:
+            o.config = config
+            status = "compiled" if o.compiled else "cached"
+            print(f"  {o.name:<52} {o.duration:6.2f} s  {status}")
+        log.extend(objs)
+    num_compiled = len([o for o in log if o.compiled])
+    print(f"{len(log)} code objects ({num_compiled} compiled) in {time() - t0:.1f} s")
+    return log
+
+
+def build_and_run(config):
+    "Build `Nto1(**config)` and run it for one timestep. Returns the code objects."
+    with timed_code_objects() as objs:
+        n, *_, net = Nto1(**config)
+        if config["weights_as_vars"]:
+            n.we, n.wi = 1 * nS, 4 * nS
+        else:
+            we, wi = 1 * nS, 4 * nS
+        net.run(defaultclock.dt)
+    return objs
+
+
+@contextmanager
+def timed_code_objects():
+    """
+    Record the name and generation + compilation time of every code object that the
+    (runtime) device creates in this block, and whether it was newly compiled.
+    """
+    dev = get_device()
+    create = dev.code_object
+    cache_dir = get_cython_cache_dir()
+    objs = []
+    def code_object(owner, name, *args, **kwargs):
+        before = cache_contents(cache_dir)
+        t0 = time()
+        codeobj = create(owner, name, *args, **kwargs)
+        duration = time() - t0
+        compiled = cache_contents(cache_dir) != before
+        objs.append(SimpleNamespace(name=name, duration=duration, compiled=compiled))
+        return codeobj
+    dev.code_object = code_object
+    try:
+        yield objs
+    finally:
+        del dev.code_object
+
+
+def cache_contents(cache_dir):
+    return set(os.listdir(cache_dir)) if cache_dir and os.path.isdir(cache_dir) else set()
+
+
+if __name__ == "__main__":
+    warm_up()
@@ -0,0 +1,146 @@
+
+# Spikes-only connection inference, from cross-correlations of all pairs of spike
+# trains at once.
+#
+# The score of a connection i → j is the number of spikes of j that follow a spike of
+# i within a short `window` (i.e. the area of the cross-correlogram (CCG) over the
+# causal lags 0 ≤ τ < window), minus the number expected if the trains were
+# independent, normalized by √(n_i n_j) (as in FNCCH, Pastore et al. 2018):
+#
+#     (C_ij - n_i n_j window / duration) / √(n_i n_j)
+#
+# Excitatory connections give positive scores, inhibitory ones negative. On the
+# AdExNet dataset, this area works better than the peak of the mean-centered CCG
+# (FNCCH's score), especially for inhibitory connections (AUC 0.997 vs 0.92).
+#
+# Pairs are never gone over one by one. All spikes are sorted by time, once. For all
+# spikes of a block of 'pre' neurons, two `searchsorted` calls then give the range of
+# spikes (of all neurons) in a window after each of them; and one `bincount` counts
+# all these spike pairs, per (pre, post) neuron pair (and per lag, for the full
+# CCGs). The work is proportional to the number of spike pairs within the window;
+# memory to (block size × N (× number of lags)).
+#
+# As in `sta.py`: times are in seconds; `spikes` is a `SpikeStore`, or a list of
+# spike time arrays. E.g., for the AdExNet dataset:
+#
+#     s = SpikeStore.from_npz("data/2024-07-01__AdExNet-Brian/spiketimes.npz",
+#                             dt=0.1e-3, duration=60)
+#     scores = connectivity_scores(s)   # Same shape as `connectivity_matrix.npy`
+
+import numpy as np
+
+from spikestore import SpikeStore
+
+
+def connectivity_scores(spikes, window = 15e-3, Δt = 0.1e-3, max_block = 2**22):
+    """
+    (N × N) matrix with the score of every connection i → j (row i: 'pre', column j:
+    'post'), as in the ground truth `W[i, j]`. The diagonal is zero.
+
+    `window`: spikes of j at 0 ≤ t - t_i < `window` after a spike of i are counted.
+    `max_block`: maximum number of entries (pre neurons × N) in memory at once.
+    """
+    s = as_spikestore(spikes, Δt)
+    N = len(s)
+    n = s.counts.astype(float)
+    w = int(round(window / s.dt))
+    scores = np.zeros((N, N))
+    for rows, C in pair_count_blocks(s.steps, s, 0, w, 1, max_block):
+        expected = np.outer(n[rows], n) * window / s.duration
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores[rows] = (C[:, :, 0] - expected) / np.sqrt(np.outer(n[rows], n))
+    scores[~np.isfinite(scores)] = 0
+    np.fill_diagonal(scores, 0)
+    return scores
+
+
+def cross_correlograms(spikes, pre = None, binsize = 1e-3, max_lag = 100e-3,
+                       Δt = 0.1e-3, max_block = 2**24):
+    """
+    Spike pair counts C[i, j, k]: the number of spikes of neuron j that fall
+    `lags[k]` bins after a spike of neuron i (with time binned by `binsize`), for
+    every neuron i in `pre` (default: all), and every neuron j.
+
+    Returns `lags` (in bins, -max_lag … +max_lag) and the (len(pre) × N × len(lags))
+    array `C`.
+    """
+    s = as_spikestore(spikes, Δt)
+    pre = np.arange(len(s)) if pre is None else np.asarray(pre)
+    K = int(round(max_lag / binsize))
+    lags = np.arange(-K, K + 1)
+    bins = s.steps.astype(np.int64) // int(round(binsize / s.dt))
+    C = np.zeros((len(pre), len(s), len(lags)), dtype=np.int64)
+    r = 0
+    for rows, Cb in pair_count_blocks(bins, s, -K, K + 1, len(lags), max_block, pre):
+        C[r : r + len(rows)] = Cb
+        r += len(rows)
+    return lags, C
+
+
+def as_spikestore(spikes, Δt = 0.1e-3):
+    if hasattr(spikes, "offsets"):
+        return spikes
+    duration = max((t[-1] for t in spikes if len(t)), default=0)
+    return SpikeStore.from_trains([np.asarray(t) for t in spikes], Δt, duration)
+
+
+def pair_count_blocks(times, s, start, stop, num_lags, max_block, pre = None):
+    """
+    Count the pairs of a spike of neuron i and a spike of neuron j with
+    `start` ≤ (t_j - t_i) < `stop`, for every i in `pre` (default: all) and every j.
+    `times`: integer time of every spike in `s` (e.g. timestep or bin indices).
+
+    With `num_lags` = 1, all pairs in the window are counted together; with
+    `num_lags` = stop - start, they are counted per lag.
+    Yields `rows` (consecutive pre neuron indices from `pre`) and their (len(rows) × N × num_lags)
+    counts, for blocks of rows that fit in `max_block` entries.
+    """
+    N = len(s)
+    L = num_lags
+    pre = np.arange(N) if pre is None else np.asarray(pre)
+    times = np.asarray(times, dtype=np.int64)
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+    # For every spike: its column (and lag, up to a per-pre-spike offset) in the
+    # flattened (rows × N × L) count array.
+    keys = s.neuron_ids[order] * L
+    if L > 1:
+        keys += sorted_times
+    B = max(1, max_block // (N * L))
+    for r0 in range(0, len(pre), B):
+        rows = pre[r0 : r0 + B]
+        size = len(rows) * N * L
+        # Spikes of the pre neurons in this block, and their row in the block.
+        ref = np.concatenate([times[s.offsets[i] : s.offsets[i+1]] for i in rows])
+        ref_row = np.repeat(np.arange(len(rows)), s.counts[rows])
+        lo = np.searchsorted(sorted_times, ref + start)
+        hi = np.searchsorted(sorted_times, ref + stop)
+        base = ref_row * (N * L)
+        if L > 1:
+            base -= ref + start
+        C = np.zeros(size, dtype=np.int64)
+        for c in pair_chunks(hi - lo, max_block):
+            C += count_pairs(lo[c], hi[c], base[c], keys, size)
+        yield rows, C.reshape(len(rows), N, L)
+
+
+def pair_chunks(num_partners, max_pairs):
+    "Split the pre spikes into slices, with at most ~`max_pairs` pairs per slice"
+    cs = np.cumsum(num_partners)
+    bounds = np.searchsorted(cs, np.arange(max_pairs, cs[-1] if len(cs) else 0,
+                                           max_pairs))
+    edges = np.unique(np.concatenate([[0], bounds + 1, [len(num_partners)]]))
+    return [slice(a, b) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def count_pairs(lo, hi, base, keys, size):
+    """
+    Histogram of `base[r] + keys[p]`, over all pairs of pre spike r and spike p in
+    `lo[r]:hi[r]`.
+    """
+    n = hi - lo
+    # Index of every partner spike: `lo` of its pre spike, plus its position in
+    # that range.
+    start = np.cumsum(n) - n
+    p = np.arange(n.sum()) + np.repeat(lo - start, n)
+    return np.bincount(np.repeat(base, n) + keys[p], minlength=size)
@@ -1,24 +1,82 @@
 #!/usr/bin/env python
+import hashlib
+import json
+import os
+import re
 import shutil
 import sys
-from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from subprocess import run
 
-from lxml import etree
-
 
 def copy_down_notebooks_dir():
     # I like my `nb/` dir to be top level (next to `pkg/` and `web/`).
     # But JupyterBook / Sphinx then can't find it. Hence copy it down to the website/
     # dir on build.
-    try:
-        shutil.copytree("../nb", "nb", dirs_exist_ok=True)
-    except shutil.Error:
-        pass
-        # A "permission denied" error is raised on my machine, but the operation
-        # succeeds succesfully anyway. So we ignore this error.
+    # Only files whose contents changed since the last build are copied (so that
+    # JupyterBook also only rebuilds those).
+    src_dir, dst_dir = Path("../nb"), Path("nb")
+    manifest = Manifest("copied")
+    num_copied = 0
+    for src in src_dir.rglob("*"):
+        if not src.is_file():
+            continue
+        rel = src.relative_to(src_dir).as_posix()
+        dst = dst_dir / rel
+        if manifest.unchanged(rel, src) and dst.exists():
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            shutil.copy2(src, dst)
+        except PermissionError:
+            pass
+            # A "permission denied" error is raised on my machine, but the operation
+            # succeeds succesfully anyway. So we ignore this error.
+        manifest.update(rel, src)
+        num_copied += 1
+    manifest.save()
+    print(f"Copied {num_copied} changed files to {dst_dir}/")
+
+
+class Manifest:
+    """
+    Content hash of every file (by name), as of the last build. `size` and `mtime`
+    are stored too: if these did not change, the file is not hashed again.
+    With `hash_contents=False`, only `size` and `mtime` are compared.
+    """
+
+    dir = Path("_build")
+
+    def __init__(self, name, hash_contents = True):
+        self.path = self.dir / f"{name}_manifest.json"
+        self.hash_contents = hash_contents
+        self.entries = json.loads(self.path.read_text()) if self.path.exists() else {}
+
+    def unchanged(self, key, file):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        st = file.stat()
+        if [st.st_size, st.st_mtime_ns] == entry[:2]:
+            return True
+        return self.hash_contents and file_hash(file) == entry[2]
+
+    def update(self, key, file):
+        st = file.stat()
+        entry = [st.st_size, st.st_mtime_ns]
+        if self.hash_contents:
+            entry.append(file_hash(file))
+        self.entries[key] = entry
+
+    def save(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries))
+
+
+def file_hash(path):
+    return hashlib.blake2b(Path(path).read_bytes(), digest_size=16).hexdigest()
 
 
 def run_jupyterbook_cmd(cmd):
@@ -35,11 +93,34 @@ google_meta_tags = (
 built_html_dir = Path("./_build/html/")
 
 
-def add_google_meta_tags_to_all_pages():
-    for path in built_html_dir.glob("**/*.html"):
-        with edit_html(path) as tree:
-            for tag in google_meta_tags:
-                add_to_head(tag, tree)
+def postprocess_built_pages():
+    """
+    Add the google meta tags to every page, and a canonical link to renamed pages.
+    Only pages that JupyterBook (re)built since the last time are processed, in
+    parallel.
+    """
+    # (No content hashes here: a page that JupyterBook rebuilt never equals the
+    # post-processed version. And `set_head_tags` is idempotent anyway).
+    manifest = Manifest("postprocessed", hash_contents=False)
+    paths = [
+        path for path in built_html_dir.glob("**/*.html")
+        if not manifest.unchanged(path.relative_to(built_html_dir).as_posix(), path)
+    ]
+    with ProcessPoolExecutor() as pool:
+        edited = list(pool.map(postprocess_page, paths, chunksize=8))
+    for path in paths:
+        manifest.update(path.relative_to(built_html_dir).as_posix(), path)
+    manifest.save()
+    print(f"Post-processed {len(paths)} new or changed pages ({sum(edited)} edited)")
+
+
+def postprocess_page(path):
+    "Returns whether the page was edited"
+    rel = path.relative_to(built_html_dir).as_posix()
+    tags = list(google_meta_tags)
+    if rel in renamed_by_new_path:
+        tags.append(canonical_link(renamed_by_new_path[rel]))
+    return set_head_tags(path, tags)
 
 
 @dataclass
@@ -61,42 +142,115 @@ renamed_pages = (
 
 website_url = "https://tfiers.github.io/phd/"
 
+renamed_by_new_path = {page.new_path: page.old_path for page in renamed_pages}
+
+
+def canonical_link(old_path):  # to retain Hypothesis annotations
+    return f'<link rel="canonical" href="{website_url + old_path}" />'
+
+
+# Streaming head editing.
+#
+# Only the `<head>` of a page is read (in chunks, up to `</head>`), instead of
+# parsing the whole page. A tag replaces any existing tag with the same identity:
+# the same `name` for `<meta>`, the same `rel` for `<link>` (e.g. the canonical link
+# that Sphinx adds). Tags that are already there as given are left alone; and if
+# nothing changes, the file is not written. Tag-like text in comments, scripts, and
+# styles is not touched.
+
+head_end = b"</head>"
+head_tag_pattern = re.compile(rb"<(meta|link)\b[^>]*>", re.IGNORECASE)
+raw_text_pattern = re.compile(
+    rb"<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)",
+    re.IGNORECASE | re.DOTALL,
+)
+attr_pattern = re.compile(rb"""([\w-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+
+def set_head_tags(path, tags, chunk_size = 2**16):
+    "Make sure `tags` are in the head of the HTML file at `path`. Returns whether edited."
+    with open(path, "rb") as f:
+        head = read_head(f, chunk_size)
+        if head is None:
+            print(f"No </head> in {path}")
+            return False
+        new_head = with_tags(head, tags)
+        if new_head == head:
+            return False
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as out:
+            out.write(new_head)
+            f.seek(len(head))
+            shutil.copyfileobj(f, out)
+    os.replace(tmp_path, path)
+    return True
+
+
+def read_head(f, chunk_size = 2**16):
+    "Bytes of `f` up to (not including) `</head>`; or None if there is no such tag"
+    buf = b""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return None
+        # (Search from a bit before the new chunk, in case the end tag straddles two).
+        start = max(0, len(buf) - len(head_end))
+        buf += chunk
+        i = buf.lower().find(head_end, start)
+        if i >= 0:
+            return buf[:i]
+
 
-def add_link_tag_to_renamed_pages():  # to retain Hypothesis annotations
-    for page in renamed_pages:
-        with edit_html(built_html_dir / page.new_path) as tree:
-            existing_link_tag = tree.find('//link[@rel="canonical"]')
-            existing_link_tag.getparent().remove(existing_link_tag)
-            add_to_head(
-                f'<link rel="canonical" href="{website_url + page.old_path}" />',
-                tree,
-            )
+def with_tags(head, tags):
+    for tag in tags:
+        tag = tag.encode()
+        key = tag_key(tag)
+        present = False
+        for m in reversed(head_tags(head)):
+            if tag_key(m.group()) != key:
+                continue
+            if tag_attrs(m.group()) == tag_attrs(tag) and not present:
+                present = True
+            else:
+                # (Remove the tag's line, if it is on its own line).
+                start = len(head[:m.start()].rstrip(b" \t"))
+                end = m.end() + 1 if head[m.end():m.end() + 1] == b"\n" else m.end()
+                head = head[:start] + head[end:]
+        if not present:
+            body = head.rstrip()
+            head = body + b"\n    " + tag + head[len(body):]
+    return head
 
 
-parser = etree.HTMLParser()
+def head_tags(head):
+    "Matches of the `<meta>` and `<link>` tags in `head` (not in comments or scripts)"
+    skip = [m.span() for m in raw_text_pattern.finditer(head)]
+    return [
+        m for m in head_tag_pattern.finditer(head)
+        if not any(a <= m.start() < b for a, b in skip)
+    ]
 
 
-@contextmanager
-def edit_html(file_path) -> etree.ElementTree:
-    file_path_str = str(file_path)
-    tree = etree.parse(file_path_str, parser)
-    try:
-        yield tree
-    except Exception as e:
-        print(f"Error editing {file_path}:", e)
-    finally:
-        tree.write(file_path_str, method="html")
-        print(f"Wrote to {file_path}")
+def tag_key(tag):
+    "Identity of a `<meta>` or `<link>` tag: its name or rel"
+    attrs = tag_attrs(tag)
+    kind = tag[1:5].lower()
+    return kind, attrs.get(b"name" if kind == b"meta" else b"rel")
 
 
-def add_to_head(tag, tree):
-    head = tree.find("head")
-    head.append(etree.fromstring(tag))
+def tag_attrs(tag):
+    return {
+        m.group(1).lower(): m.group(2) if m.group(2) is not None else m.group(3)
+        for m in attr_pattern.finditer(tag)
+    }
 
 
 if __name__ == "__main__":
     copy_down_notebooks_dir()
+    if "--execute" in sys.argv:
+        # Re-run the jupytext `.py` notebooks (with cached cell outputs).
+        from execute import execute_notebooks
+        execute_notebooks()
     # run_jupyterbook_cmd("clean")
     run_jupyterbook_cmd("build")
-    add_google_meta_tags_to_all_pages()
-    add_link_tag_to_renamed_pages()
+    postprocess_built_pages()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# Execute the jupytext `.py` notebooks in `nb/` headless, for the website, with the
+# outputs of every code cell cached on disk.
+#
+# A cell's cache key is the hash of its source, the key of the code cell before it
+# (so, transitively, of all code above it), and the contents of the files it
+# references: the `%run` scripts (and the modules next to them), and string literals
+# that are paths of existing files (e.g. "data/2023-08-05__AdEx_Nto1_we_sweep.csv").
+# Files that the notebook itself writes (e.g. `df.to_csv(…)` of that same file) are
+# outputs, not inputs: they are left out, else such a cell would never be cached.
+# They are found by comparing the referenced files before and after a run, and kept
+# in `{notebook}.written.json` in the cache. Markdown cells are not part of the
+# chain: editing prose reruns nothing.
+#
+# The outputs of the longest unchanged prefix of a notebook are restored from the
+# cache. If the whole notebook is unchanged, no kernel is started. Otherwise, the
+# kernel state at the first changed cell is rebuilt by running the prefix again
+# (its outputs are discarded); long simulations in it should go through
+# `diskcache.cache`, so that this is fast. Then the rest is executed, and cached.
+#
+# The executed notebooks are written to `web/nb/`, from where JupyterBook builds
+# them (with `execute_notebooks: off`). Usage, from `web/`:
+#
+#     python execute.py [notebook.py …]
+#
+# or `python build.py --execute`.
+
+import hashlib
+import json
+import re
+import sys
+from pathlib import Path
+from time import perf_counter
+
+src_dir = Path("../nb")
+out_dir = Path("nb")
+cell_cache_dir = Path("_build/cell_cache")
+
+
+def execute_notebooks(paths = None, kernel_name = "python3"):
+    "Execute the given (default: all) paired `.py` notebooks, with cached cell outputs"
+    if paths is None:
+        paths = paired_notebooks()
+    for path in paths:
+        execute_notebook(Path(path), kernel_name)
+
+
+def paired_notebooks():
+    "The `.py` files in `nb/` that are jupytext notebooks"
+    return sorted(
+        path for path in src_dir.glob("*.py")
+        if "jupytext:" in path.read_text(encoding="utf-8")[:1000]
+    )
+
+
+def execute_notebook(path, kernel_name = "python3"):
+    import jupytext
+    import nbformat
+    t0 = perf_counter()
+    nb = jupytext.read(path)
+    code_cells = [cell for cell in nb.cells if cell.cell_type == "code"]
+    written = load_written(path)
+    keys = cell_keys(code_cells, path.parent, written)
+    num_restored = 0
+    for cell, key in zip(code_cells, keys):
+        cached = load_cell(key)
+        if cached is None:
+            break
+        cell.outputs = nbformat.from_dict(cached["outputs"])
+        cell.execution_count = cached["execution_count"]
+        num_restored += 1
+    num_run = len(code_cells) - num_restored
+    if num_run > 0:
+        before = input_snapshot(code_cells, path.parent)
+        num_ok = run_cells(nb, code_cells, num_restored, path.parent, kernel_name)
+        after = input_snapshot(code_cells, path.parent)
+        changed = {f for f in before.keys() | after.keys()
+                   if before.get(f) != after.get(f)}
+        if changed - written:
+            written |= changed
+            store_written(path, written)
+            keys = cell_keys(code_cells, path.parent, written)
+        for cell, key in zip(code_cells[:num_ok], keys):
+            store_cell(key, cell)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    nbformat.write(nb, out_dir / f"{path.stem}.ipynb")
+    print(f"{path.name}: {num_restored} cells restored, {num_run} executed "
+          f"({perf_counter() - t0:.1f} s)")
+
+
+def run_cells(nb, code_cells, start, cwd, kernel_name):
+    """
+    Run all code cells in a fresh kernel: the first `start` cells only to rebuild the
+    kernel state (keeping their cached outputs); the others for their outputs.
+    Returns the number of cells before the first one that errors (to be cached).
+    """
+    from nbclient import NotebookClient
+    client = NotebookClient(
+        nb,
+        kernel_name=kernel_name,
+        timeout=None,
+        allow_errors=True,
+        resources={"metadata": {"path": str(cwd)}},
+    )
+    index = {id(cell): i for i, cell in enumerate(nb.cells)}
+    num_ok = start
+    with client.setup_kernel():
+        for n, cell in enumerate(code_cells):
+            if n < start:
+                outputs, count = cell.outputs, cell.execution_count
+                client.execute_cell(cell, index[id(cell)])
+                cell.outputs, cell.execution_count = outputs, count
+                continue
+            client.execute_cell(cell, index[id(cell)])
+            failed = any(o.output_type == "error" for o in cell.outputs)
+            if num_ok == n and not failed:
+                num_ok += 1
+    return num_ok
+
+
+def cell_keys(code_cells, cwd, written = ()):
+    """
+    Cache key of every code cell (chained: each includes the key of the one above).
+    `written`: paths (as str) of files that the notebook writes, which are ignored.
+    """
+    keys = []
+    prev = ""
+    for cell in code_cells:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(prev.encode())
+        h.update(cell.source.encode())
+        for file in referenced_files(cell.source, cwd):
+            if str(file) not in written:
+                h.update(f"{file}:{file_hash(file)}".encode())
+        prev = h.hexdigest()
+        keys.append(prev)
+    return keys
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "blake2b").hexdigest()
+
+
+def input_snapshot(code_cells, cwd):
+    "Size and mtime of every file referenced by the given cells"
+    snapshot = {}
+    for cell in code_cells:
+        for file in referenced_files(cell.source, cwd):
+            st = file.stat()
+            snapshot[str(file)] = (st.st_size, st.st_mtime_ns)
+    return snapshot
+
+
+run_magic = re.compile(r"^\s*%run\s+(\S+)", re.MULTILINE)
+string_literal = re.compile(r"""["']([^"'\n]+)["']""")
+
+
+def referenced_files(source, cwd):
+    """
+    Existing files (relative to `cwd`) that cell `source` refers to. For `%run`
+    scripts, this includes the modules next to them (which they import).
+    """
+    files = set()
+    for name in run_magic.findall(source):
+        script = cwd / name
+        if script.is_file():
+            files.update(script.parent.glob("*.py"))
+    for name in string_literal.findall(source):
+        file = cwd / name
+        if "\0" not in name and file.is_file():
+            files.add(file)
+    return sorted(files)
+
+
+def load_written(notebook):
+    path = cell_cache_dir / f"{notebook.stem}.written.json"
+    return set(json.loads(path.read_text(encoding="utf-8"))) if path.exists() else set()
+
+
+def store_written(notebook, written):
+    cell_cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cell_cache_dir / f"{notebook.stem}.written.json"
+    path.write_text(json.dumps(sorted(written)), encoding="utf-8")
+
+
+def load_cell(key):
+    path = cell_cache_dir / f"{key}.json"
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+
+def store_cell(key, cell):
+    cell_cache_dir.mkdir(parents=True, exist_ok=True)
+    entry = dict(outputs=cell.outputs, execution_count=cell.execution_count)
+    (cell_cache_dir / f"{key}.json").write_text(json.dumps(entry), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    execute_notebooks(sys.argv[1:] or None)